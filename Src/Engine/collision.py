@@ -0,0 +1,133 @@
+# 17.10.26
+
+from typing import Tuple
+
+
+# External libraries
+import numpy as np
+
+
+# Internal utilities
+from .enemy import TYPE_TABLE, Danger
+
+
+# Variable
+# Hitboxes as (dx, dy, width, height) from the decoded entity position, keyed like ENEMY_TYPES.
+# The first sprite tile of an entity is drawn at (x + 1, y + 2); boxes are smaller than the sprites,
+# the Chibibo box is calibrated on the frame in which it kills Mario in 1-1
+SMALL_HITBOX = (3, 3, 4, 6)             # 8x8 sprites: Chibibo, fireballs, bullets
+DEFAULT_HITBOX = (3, 3, 12, 12)         # 16x16 sprites
+PLATFORM_HITBOX = (1, 2, 32, 8)
+BOSS_HITBOX = (3, 3, 28, 28)
+
+HITBOXES = {
+    0x00: SMALL_HITBOX,                 # Chibibo
+    0x01: SMALL_HITBOX,
+    0x05: SMALL_HITBOX,                 # Nokobon's bomb
+    0x07: PLATFORM_HITBOX,
+    0x08: BOSS_HITBOX,
+    0x0A: PLATFORM_HITBOX,
+    0x0B: PLATFORM_HITBOX,
+    0x0C: (1, 2, 8, 8),                 # Falling tile
+    0x13: PLATFORM_HITBOX,
+    0x14: PLATFORM_HITBOX,
+    0x16: SMALL_HITBOX,
+    0x18: SMALL_HITBOX,
+    0x1A: BOSS_HITBOX,
+    0x1B: SMALL_HITBOX,
+    0x1E: SMALL_HITBOX,
+    0x1F: SMALL_HITBOX,
+    0x22: SMALL_HITBOX,
+    0x23: SMALL_HITBOX,
+    0x38: PLATFORM_HITBOX,
+    0x39: PLATFORM_HITBOX,
+    0x3A: PLATFORM_HITBOX,
+    0x3B: PLATFORM_HITBOX,
+    0x45: SMALL_HITBOX,                 # Falling arrow
+    0x4A: (1, 3, 16, 6),                # Gira (Bullet Bill)
+    0x4B: SMALL_HITBOX,
+    0x4C: PLATFORM_HITBOX,
+    0x4D: PLATFORM_HITBOX,
+    0x50: SMALL_HITBOX,
+    0x54: SMALL_HITBOX,
+    0x58: SMALL_HITBOX,
+    0x5A: SMALL_HITBOX,
+    0x5D: SMALL_HITBOX,
+    0x5E: SMALL_HITBOX,
+    0x5F: SMALL_HITBOX,
+    0x60: BOSS_HITBOX,
+    0x61: BOSS_HITBOX,
+    0x71: SMALL_HITBOX,
+    0x73: SMALL_HITBOX,
+    0x74: SMALL_HITBOX,
+    0x77: SMALL_HITBOX,
+}
+
+# Mario's box from his decoded position (x, y); his first sprite tile is at (x + 1, y - 2)
+MARIO_SMALL_HITBOX = (5, 0, 8, 14)
+MARIO_BIG_HITBOX = (5, -14, 8, 28)
+
+
+def _compile_table():
+    table = np.tile(np.array(DEFAULT_HITBOX, dtype=np.int16), (256, 1))
+    for i_type, hitbox in HITBOXES.items():
+        table[i_type] = hitbox
+    return table
+
+
+HITBOX_TABLE = _compile_table()                                     # (256, 4) dx, dy, width, height
+HAZARD_TABLE = TYPE_TABLE['danger'] != Danger.HARMLESS              # Types that can hurt Mario
+
+
+def mario_box(x: int, y: int, powerup_status: int = 0) -> np.ndarray:
+    """Mario's box as [left, top, right, bottom), big Mario is taller"""
+    dx, dy, width, height = MARIO_BIG_HITBOX if powerup_status else MARIO_SMALL_HITBOX
+    return np.array([x + dx, y + dy, x + dx + width, y + dy + height], dtype=np.int32)
+
+
+def entity_boxes(i_types: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """(n, 4) boxes [left, top, right, bottom) of the entities, from the hitbox table"""
+    hitboxes = HITBOX_TABLE[i_types]
+    boxes = np.empty((len(hitboxes), 4), dtype=np.int32)
+    boxes[:, 0] = xs + hitboxes[:, 0]
+    boxes[:, 1] = ys + hitboxes[:, 1]
+    boxes[:, 2] = boxes[:, 0] + hitboxes[:, 2]
+    boxes[:, 3] = boxes[:, 1] + hitboxes[:, 3]
+    return boxes
+
+
+def overlaps(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """AABB test of one box against every box"""
+    return ((boxes[:, 0] < box[2]) & (box[0] < boxes[:, 2]) &
+            (boxes[:, 1] < box[3]) & (box[1] < boxes[:, 3]))
+
+
+def gaps(box: np.ndarray, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Signed horizontal gap (positive to the right of box) and vertical gap to every box, 0 when they overlap"""
+    right = boxes[:, 0] - box[2]
+    left = boxes[:, 2] - box[0]
+    gap_x = np.where(right >= 0, right, np.where(left <= 0, left, 0))
+    gap_y = np.maximum(np.maximum(boxes[:, 1] - box[3], box[1] - boxes[:, 3]), 0)
+    return gap_x, gap_y
+
+
+def nearest_threat(box: np.ndarray, boxes: np.ndarray, i_types: np.ndarray, facing: int = 0,
+                   max_distance: float = np.inf) -> Tuple[int, float]:
+    """
+    Index and edge distance of the closest hazard; facing=1 only looks right of Mario, -1 only left, 0 everywhere.
+    Returns (-1, inf) when there is none within max_distance.
+    """
+    if len(boxes) == 0:
+        return -1, float('inf')
+
+    gap_x, gap_y = gaps(box, boxes)
+    distances = np.hypot(gap_x, gap_y)
+    candidates = HAZARD_TABLE[i_types] & (distances <= max_distance)
+    if facing:
+        candidates &= (gap_x * facing >= 0)
+
+    if not candidates.any():
+        return -1, float('inf')
+
+    index = int(np.argmin(np.where(candidates, distances, np.inf)))
+    return index, float(distances[index])
@@ -3,6 +3,32 @@
 from dataclasses import dataclass
 
 
+# External libraries
+import numpy as np
+
+
+# Internal utilities
+from .enemy import enemy_name
+
+
+# Variable
+ENTITY_COUNT = 10
+
+# One row per entity slot of the 0xD100-0xD19F table
+ENTITY_DTYPE = np.dtype([
+    ('slot', np.uint8),
+    ('i_type', np.uint8),
+    ('hp', np.uint8),
+    ('x', np.int16),
+    ('y', np.int16),
+    ('pose', np.uint8),
+    ('timer', np.uint8),
+    ('distance', np.float32),
+    ('collisione', np.bool_),
+    ('active', np.bool_),
+])
+
+
 @dataclass
 class Position:
     x: int              # Absolute X position
@@ -53,7 +79,6 @@ class LocalPlayer:
 @dataclass
 class Entity:
     i_type: int
-    type: str
     position: Position
     rect: Rect
     hp: int
@@ -61,6 +86,11 @@ class Entity:
     distance: float
     collisione: bool
 
+    @property
+    def type(self) -> str:
+        # Name resolved only when displayed
+        return enemy_name(self.i_type)
+
 
 @dataclass
 class LandGame:
@@ -1,5 +1,9 @@
 # 28.10.24
 
+# External libraries
+import numpy as np
+
+
 ENEMY_TYPES = {
     0x00: "Chibibo (Goomba)",
     0x01: "Flattened Chibibo",
@@ -129,3 +133,67 @@ ENEMY_TYPES = {
     0x7D: "Random Sprite Killer",
     0x7E: "Static Enemy"
 }
+
+
+class Category:
+    # Entity categories of TYPE_TABLE
+    NONE = 0            # Empty or unknown type
+    HAZARD = 1
+    PLATFORM = 2
+    POWERUP = 3
+    PROJECTILE = 4
+    BOSS = 5
+    TRIGGER = 6
+    EFFECT = 7          # Death animations, sounds and explosions
+
+class Danger:
+    # What touching the entity does to Mario
+    HARMLESS = 0
+    STOMPABLE = 1       # Hurts from the side, dies if Mario lands on it
+    LETHAL = 2          # Hurts from every side
+
+
+# Types not listed in CATEGORIES but present in ENEMY_TYPES are hazards
+CATEGORIES = {
+    Category.NONE: (0x0D, 0x11, 0x12, 0x1C, 0x26, 0x37, 0x4E, 0x66),
+    Category.PLATFORM: (0x07, 0x0A, 0x0B, 0x0C, 0x13, 0x14, 0x38, 0x39, 0x3A, 0x3B, 0x47, 0x4C, 0x4D),
+    Category.POWERUP: (0x28, 0x29, 0x2A, 0x2B, 0x2C, 0x2D, 0x2E, 0x34),
+    Category.PROJECTILE: (0x05, 0x16, 0x18, 0x1B, 0x1E, 0x1F, 0x21, 0x22, 0x23, 0x35, 0x36, 0x45, 0x4A, 0x4B,
+                          0x50, 0x51, 0x54, 0x58, 0x5A, 0x5D, 0x5E, 0x5F, 0x71, 0x73, 0x74, 0x77),
+    Category.BOSS: (0x08, 0x17, 0x1A, 0x60, 0x61),
+    Category.TRIGGER: (0x32, 0x59, 0x5B, 0x6D),
+    Category.EFFECT: (0x01, 0x0F, 0x15, 0x19, 0x27, 0x3D, 0x3E, 0x40, 0x41, 0x43, 0x44, 0x46, 0x4F, 0x5C, 0x62),
+}
+
+# Hazards that Mario can kill by landing on them, the other hazards, projectiles and bosses are lethal
+STOMPABLE_TYPES = (0x00, 0x04, 0x09, 0x0E, 0x20, 0x24, 0x25, 0x2F, 0x31, 0x33, 0x3C, 0x42, 0x53, 0x56, 0x57,
+                   0x63, 0x69)
+
+# Numeric attributes of every type byte, indexed with the raw i_type
+TYPE_DTYPE = np.dtype([
+    ('category', np.uint8),
+    ('danger', np.uint8),
+    ('known', np.bool_),
+])
+
+
+def _compile_type_table() -> np.ndarray:
+    table = np.zeros(256, dtype=TYPE_DTYPE)
+    for i_type in ENEMY_TYPES:
+        table[i_type] = (Category.HAZARD, Danger.LETHAL, True)
+
+    for category, i_types in CATEGORIES.items():
+        table['category'][list(i_types)] = category
+        if category not in (Category.PROJECTILE, Category.BOSS):
+            table['danger'][list(i_types)] = Danger.HARMLESS
+
+    table['danger'][list(STOMPABLE_TYPES)] = Danger.STOMPABLE
+    return table
+
+
+TYPE_TABLE = _compile_type_table()
+
+
+def enemy_name(i_type: int) -> str:
+    """Display name of a type byte, only needed for printing and visualization"""
+    return ENEMY_TYPES.get(i_type, f"Unknown (0x{i_type:02X})")
@@ -1,31 +1,32 @@
 # 28.10.24
 
-import math
-from typing import List, Dict
+from typing import List, Dict, Union
 
 
 # External libraries
+import numpy as np
 from pyboy import PyBoy
 
 
 # Internal utilities
-from .offset import Offset, EntityProperty
-from .dataclass import Position, Timer, LocalPlayer, LandGame, Entity, Rect
-from .enemy import ENEMY_TYPES
+from .offset import Offset, EntityProperty, GameStatus
+from .schema import GAME_STATE_SCHEMA, is_alive
+from .dataclass import Position, Timer, LocalPlayer, LandGame, Entity, Rect, ENTITY_COUNT, ENTITY_DTYPE
+from .snapshot import GameStateSnapshot, Player, Enemy, SCALE
+from .tiles import overlay_entities
+from .phase import detect_phase
+from .enemy import TYPE_TABLE
+from .collision import mario_box, entity_boxes, overlaps, gaps
 
 
 # Variable
-SCALE = 3
+ENTITY_SIZE = 0x10
 
 
-def bcm_to_dec(value: int) -> int:
-    return (value >> 4) * 10 + (value & 0x0F)
-
-def create_rect(x: int, y: int, border: int) -> Rect:
-    return Rect(x * SCALE, y * SCALE, border * SCALE, border * SCALE)
-
-def calculate_distance(x1, y1, x2, y2):
-    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+def box_rect(box) -> Rect:
+    """Rect in screen scale from a [left, top, right, bottom) hitbox"""
+    left, top, right, bottom = (int(value) for value in box)
+    return Rect(left * SCALE, top * SCALE, (right - left) * SCALE, (bottom - top) * SCALE)
 
 class MarioLandMonitor:
     def __init__(self, pyboy_instance: PyBoy):
@@ -33,131 +34,230 @@ class MarioLandMonitor:
         self.game_wrapper = self.pyboy.game_wrapper
         self.memory = pyboy_instance.memory
         self.previous_state = None
-        self.enemy_types = ENEMY_TYPES
+
+        # Buffer riutilizzato ad ogni scansione della tabella entità
+        self._entity_table = np.zeros(ENTITY_COUNT, dtype=ENTITY_DTYPE)
+        self._entity_table['slot'] = np.arange(ENTITY_COUNT)
+        self._entity_boxes = np.zeros((ENTITY_COUNT, 4), dtype=np.int32)     # Hitbox di ogni slot
+        self._mario_box = np.zeros(4, dtype=np.int32)
+
+        # Cache per frame: lo stato viene decodificato al massimo una volta per frame emulato.
+        # Due snapshot usati a turno, così lo snapshot del frame precedente resta valido
+        self._state = None
+        self._state_frame = -1
+        self._snapshots = (GameStateSnapshot(), GameStateSnapshot())
+        self._snapshot_index = 0
+        self._snapshot_frame = -1
     
-    def _calculate_position(self) -> Position:
-        #level_block = self.memory[Offset.LEVEL_BLOCK]
-        rel_x = self.memory[Offset.MARIO_X_POS] - 16
-        rel_y = self.memory[Offset.MARIO_Y_POS] - 20
-        scroll_x = self.memory[Offset.SCROLL_X]
+    def invalidate(self):
+        """Drop the cached state, needed when memory changes without a tick (e.g. load_state)"""
+        self._state_frame = -1
+        self._snapshot_frame = -1
+
+    def read_state(self) -> Dict:
+        frame = self.pyboy.frame_count
+
+        if frame != self._state_frame:
+            self._state = GAME_STATE_SCHEMA.read(self.memory)
+            self._state_frame = frame
+
+        return self._state
 
-        # Calculate real X position
-        #real_offset = (scroll_x - 7) % 16 if (scroll_x - 7) % 16 != 0 else 16
-        #abs_x = (level_block * 16) + real_offset + rel_x
+    def _calculate_position(self, state: Dict) -> Position:
+        rel_x = state['mario_x'] - 16
+        rel_y = state['mario_y'] - 20
+        scroll_x = state['scroll_x']
 
+        # The real X position from the start of the level is schema.absolute_x(state)
         return Position(
             x=rel_x,
             y=rel_y,
             scroll_x=scroll_x
         )
 
-    def _read_mario_state(self) -> Dict:
-        return {
-            'direction': "Left" if self.memory[0xC20D] == 0x20 else "Right",
-            'jump_state': {
-                0x00: "Not Jumping",
-                0x01: "Ascending",
-                0x02: "Descending"
-            }.get(self.memory[Offset.JUMP_STATE], "Unknown"),
-            'y_speed': self.memory[Offset.Y_SPEED],
-            'grounded': bool(self.memory[Offset.GROUNDED])
-        }
-
-    def _scan_enemy_table(self, mario_position: Position) -> List[Dict]:
-        active_enemies = []
-        
-        for i in range(10):
-            ptr_entity = Offset.ENTITY_LIST + (i * 0x10)
-            entity = self.memory[ptr_entity]
-            health = self.memory[ptr_entity + EntityProperty.HP]
-            x_pos = self.memory[ptr_entity + EntityProperty.X_POS] - 9
-            y_pos = self.memory[ptr_entity + EntityProperty.Y_POS] - 18
-
-            # Calcola la distanza tra Mario e il nemico
-            distance = calculate_distance(mario_position.x * SCALE, mario_position.y * SCALE, x_pos * SCALE, y_pos * SCALE)
-            
-            if entity == 255:
-                continue
+    def _read_entity_table(self, mario_x: int, mario_y: int, powerup_status: int = 0) -> np.ndarray:
+        # Read the whole entity table with a single slice and decode every slot at once
+        start = Offset.ENTITY_LIST
+        raw = np.array(self.memory[start:start + ENTITY_COUNT * ENTITY_SIZE], dtype=np.uint8)
+        raw = raw.reshape(ENTITY_COUNT, ENTITY_SIZE)
+
+        table = self._entity_table
+        table['i_type'] = raw[:, EntityProperty.TYPE]
+        table['hp'] = raw[:, EntityProperty.HP]
+        table['x'] = raw[:, EntityProperty.X_POS].astype(np.int16) - 9
+        table['y'] = raw[:, EntityProperty.Y_POS].astype(np.int16) - 18
+        table['pose'] = raw[:, EntityProperty.POSE]
+        table['timer'] = raw[:, EntityProperty.TIMER]
+
+        # Calcola la distanza tra Mario e tutti i nemici
+        distance = np.hypot(
+            (table['x'] - mario_x) * SCALE,
+            (table['y'] - mario_y) * SCALE
+        )
+        table['distance'] = distance
 
-            if health == 0:
-                continue
-            
+        # Collisione: hitbox di Mario contro le hitbox di tutti gli slot in un solo test AABB
+        self._mario_box = mario_box(mario_x, mario_y, powerup_status)
+        self._entity_boxes = entity_boxes(table['i_type'], table['x'], table['y'])
+        table['collisione'] = overlaps(self._mario_box, self._entity_boxes)
+        table['active'] = (table['i_type'] != 255) & (table['hp'] != 0)
+
+        return table
+
+    def _scan_enemy_table(self, mario_position: Position, as_array: bool = False) -> Union[List[Entity], np.ndarray]:
+        table = self._read_entity_table(mario_position.x, mario_position.y, self.read_state()['powerup_status'])
+        mask = table['active']
+        active = table[mask]
+
+        if as_array:
+            return active
+
+        active_enemies = []
+        boxes = self._entity_boxes[mask]
+        for (slot, entity, health, x_pos, y_pos, pose, _, distance, collisione, _), box in zip(active.tolist(), boxes):
             active_enemies.append(Entity(
                 i_type=entity,
-                type=self.enemy_types.get(entity, f"Unknown (0x{entity:02X})"),
                 position=Position(x_pos, y_pos, None),
-                rect=create_rect(x_pos, y_pos, 10),
+                rect=box_rect(box),
                 hp=health,
-                pose=self.memory[ptr_entity + EntityProperty.POSE],
+                pose=pose,
                 distance=distance,
-                collisione=(distance < 31)
+                collisione=collisione
             ))
             
         return active_enemies
 
-    def _is_alive(self):
-
-        # 58  -> Game over
-        # 0   -> LandGame
-        # 15  -> StartUp 
-        # 1-4 -> Dead
-        GAME_STATES_DEAD = (1, 3, 4, 60)
-        TIMER_DEATH = 0x90
-
-        if self.pyboy.memory[Offset.GAME_OVER] in GAME_STATES_DEAD:
-            return False
-    
-        if self.pyboy.memory[Offset.POWERUP_STATUS_TIMER] == TIMER_DEATH:
-            return False
-
-        return True
+    def _is_alive(self, state: Dict = None) -> bool:
+        if state is None:
+            if self._state_frame == self.pyboy.frame_count:
+                state = self._state
+            else:
+                # Probe economico: solo i due byte necessari
+                state = {
+                    'game_state': self.memory[Offset.GAME_OVER],
+                    'powerup_status_timer': self.memory[Offset.POWERUP_STATUS_TIMER]
+                }
+
+        return is_alive(state)
+
+    def phase(self) -> int:
+        """Current Phase, from four single byte reads (cheap enough to probe every frame)"""
+        memory = self.memory
+        return detect_phase(
+            memory[Offset.GAME_OVER],
+            memory[Offset.POWERUP_STATUS_TIMER],
+            memory[Offset.IN_GAME],
+            memory[Offset.CURRENT_WORLD]
+        )
     
-    def get_game_state(self):
-        mario_state = self._read_mario_state()
-        mario_position = self._calculate_position()
-        active_enemies = self._scan_enemy_table(mario_position)
-        int_livesLeft = bcm_to_dec(self.pyboy.memory[0xDA15])
+    def get_game_state(self, as_array: bool = False):
+        state = self.read_state()
+        mario_position = self._calculate_position(state)
+        active_enemies = self._scan_enemy_table(mario_position, as_array)
 
         local_player = LocalPlayer(
             position=mario_position,
-            rect=create_rect(mario_position.x, mario_position.y, 16),
-            pose=self.memory[Offset.MARIO_POSE],
-            direction=mario_state['direction'],
-            jump_state=mario_state['jump_state'],
-            speed_y=mario_state['y_speed'],
-            grounded=mario_state['grounded'],
-            starman_timer=self.memory[Offset.STARMAN_TIMER],
-            powerup_status=self.memory[Offset.POWERUP_STATUS],
-            hard_mode=bool(self.memory[Offset.HARD_MODE_FLAG]),
-            powerup_status_timer=self.memory[Offset.POWERUP_STATUS_TIMER],
-            has_superball=bool(self.memory[Offset.HAS_SUPERBALL]),
+            rect=box_rect(self._mario_box),
+            pose=state['mario_pose'],
+            direction=state['direction'],
+            jump_state=state['jump_state'],
+            speed_y=state['y_speed'],
+            grounded=state['grounded'],
+            starman_timer=state['starman_timer'],
+            powerup_status=state['powerup_status'],
+            hard_mode=state['hard_mode'],
+            powerup_status_timer=state['powerup_status_timer'],
+            has_superball=state['has_superball'],
         )
 
         # Create the Timer instance using hundreds, tens, and ones memory values
         timer = Timer(
-            hundreds=self.memory[Offset.TIMER_HUNDREDS],
-            tens=self.memory[Offset.TIMER_TENS],
-            ones=self.memory[Offset.TIMER_ONES]
+            hundreds=state['timer_hundreds'],
+            tens=state['timer_tens'],
+            ones=state['timer_ones']
         )
 
-        # Calculate the coins value
-        coins = (self.memory[Offset.COINS] // 10) * 10 + (self.memory[Offset.COINS] % 10)
-
         land_game = LandGame(
-            current_world=self.memory[Offset.CURRENT_WORLD],
-            current_stage=self.memory[Offset.CURRENT_STAGE],
-            score=self.game_wrapper.score,
-            lives=int_livesLeft,
-            coins=coins,
+            current_world=state['current_world'],
+            current_stage=state['current_stage'],
+            score=state['score'],
+            lives=state['lives'],
+            coins=state['coins'],
             timer=timer,
-            in_game=self.memory[Offset.IN_GAME] != 57,
-            game_over=self.memory[Offset.GAME_OVER] == 58,
-            is_alive=self._is_alive(),
-            is_startup=self.pyboy.memory[Offset.GAME_OVER] == 15
+            in_game=state['in_game'],
+            game_over=state['game_state'] == GameStatus.GAME_OVER,
+            is_alive=self._is_alive(state),
+            is_startup=state['game_state'] == GameStatus.STARTUP
         )
 
         return local_player, land_game, active_enemies
 
+    def fill_snapshot(self, snapshot: GameStateSnapshot) -> GameStateSnapshot:
+        """Decode the current frame into the preallocated buffers of snapshot"""
+        state = self.read_state()
+        snapshot.state = state
+
+        x = state['mario_x'] - 16
+        y = state['mario_y'] - 20
+        p = snapshot.player_state
+        table = self._read_entity_table(x, y, state['powerup_status'])
+        box = snapshot.mario_box
+        box[:] = self._mario_box
+
+        p[Player.X] = x
+        p[Player.Y] = y
+        p[Player.RECT_LEFT] = box[0] * SCALE
+        p[Player.RECT_TOP] = box[1] * SCALE
+        p[Player.RECT_WIDTH] = (box[2] - box[0]) * SCALE
+        p[Player.RECT_HEIGHT] = (box[3] - box[1]) * SCALE
+        p[Player.DIRECTION_RIGHT] = state['direction'] == "Right"
+        p[Player.JUMPING] = state['jump_state'] in ("Ascending", "Descending")
+        p[Player.GROUNDED] = state['grounded']
+        p[Player.STARMAN_TIMER] = state['starman_timer']
+
+        active = table['active']
+        n = int(np.count_nonzero(active))
+        snapshot.enemy_count = n
+        snapshot.entities[:n] = table[active]
+        boxes = snapshot.boxes
+        boxes[:n] = self._entity_boxes[active]
+
+        # Encoding senza dizionari: categoria e pericolosità dalla tabella dei tipi, gap dalle hitbox
+        rows = snapshot.entities[:n]
+        types = TYPE_TABLE[rows['i_type']]
+        gap_x, gap_y = gaps(box, boxes[:n])
+        e = snapshot.enemies_state
+        e[:n, Enemy.TYPE] = rows['i_type']
+        e[:n, Enemy.X] = rows['x']
+        e[:n, Enemy.Y] = rows['y']
+        e[:n, Enemy.GAP_X] = gap_x
+        e[:n, Enemy.GAP_Y] = gap_y
+        e[:n, Enemy.HP] = rows['hp']
+        e[:n, Enemy.POSE] = rows['pose']
+        e[:n, Enemy.DISTANCE] = rows['distance']
+        e[:n, Enemy.COLLISIONE] = rows['collisione']
+        e[:n, Enemy.CATEGORY] = types['category']
+        e[:n, Enemy.DANGER] = types['danger']
+        e[n:] = 0
+
+        return snapshot
+
+    def snapshot(self) -> GameStateSnapshot:
+        """Snapshot of the current frame, decoded only once per emulated frame"""
+        frame = self.pyboy.frame_count
+
+        if frame != self._snapshot_frame:
+            self._snapshot_index ^= 1
+            self.fill_snapshot(self._snapshots[self._snapshot_index])
+            self._snapshot_frame = frame
+
+        return self._snapshots[self._snapshot_index]
+
+    def fill_tile_grid(self, grid: np.ndarray, snapshot: GameStateSnapshot) -> np.ndarray:
+        """Game area tile ids (mapping set on pyboy) with the decoded entities of snapshot on top"""
+        grid[:, :, 0] = self.pyboy.game_area()
+        return overlay_entities(grid, snapshot.active_entities, snapshot.state['level_scroll_x'])
+
     def print_state_changes(self, local_player: LocalPlayer, land_game: LandGame, active_enemies: List[Dict]):
         if self.previous_state is None:
             self.previous_state = (local_player, land_game, active_enemies)
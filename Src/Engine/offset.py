@@ -8,6 +8,21 @@ class EntityProperty:
     POSE = 0x6
     TIMER = 0x8
 
+class GameStatus:
+
+    # Values of the game state byte (0xFFB3)
+    PLAYING = 0
+    LEVEL_START = 2
+    AUTOSCROLL = 13     # Playing in the autoscroll stages (2-3, 4-3)
+    STARTUP = 15
+    NOT_IN_GAME = 57    # Value of IN_GAME outside of a level
+    GAME_OVER = 58
+    DEAD = (1, 3, 4, 60)
+    LEVEL_END = (5, 6, 7, 8)    # Goal reached: timer countdown, gate, fade out
+
+    # Value of POWERUP_STATUS_TIMER while Mario is dying
+    TIMER_DEATH = 0x90
+
 class Offset:
 
     # Mario's Position and Game Information
@@ -19,6 +34,11 @@ class Offset:
     JUMP_STATE = 0xC207
     Y_SPEED = 0xC208
     GROUNDED = 0xC20A
+    DIRECTION = 0xC20D
+
+    # Level progress: 16 pixel block and SCX of the game area (0xFF43 is reset to 0 for the HUD)
+    LEVEL_PROGRESS = 0xC0AB
+    LEVEL_SCROLL_X = 0xFFF3
 
     # Game State Offsets
     SCORE = 0x9820       # 6 bytes for score (0x9820 - 0x9825)
@@ -0,0 +1,58 @@
+# 17.10.26
+
+# Internal utilities
+from .offset import GameStatus
+
+
+# Variable
+WORLD_TILES = range(1, 5)       # HUD world digit while a level is loaded (0 during boot, blank on the title)
+PLAYING_STATES = (GameStatus.PLAYING, GameStatus.AUTOSCROLL)
+TITLE_STATES = (14, GameStatus.STARTUP, 17)
+GAME_OVER_STATES = (GameStatus.NOT_IN_GAME, GameStatus.GAME_OVER)
+TRANSITION_STATES = (GameStatus.LEVEL_START,) + GameStatus.LEVEL_END
+
+class Phase:
+    BOOT = 0
+    TITLE = 1
+    PLAYING = 2
+    DYING = 3
+    TRANSITION = 4      # Level start, life start, end of level
+    GAME_OVER = 5
+
+    NAMES = {
+        BOOT: "Boot",
+        TITLE: "Title",
+        PLAYING: "Playing",
+        DYING: "Dying",
+        TRANSITION: "Transition",
+        GAME_OVER: "Game Over",
+    }
+
+
+def detect_phase(game_state: int, powerup_status_timer: int, in_game: int, world: int) -> int:
+    """
+    Classify the current frame from the game state byte, the death timer and the in-game flag.
+    Only the known non-interactive states are listed: any other value (pipes, bonus game, ...) counts as playing,
+    so that the environment never fast-forwards through frames the agent could act on.
+    """
+    if game_state in PLAYING_STATES:
+        return Phase.PLAYING if world in WORLD_TILES else Phase.BOOT
+
+    if game_state in GameStatus.DEAD or powerup_status_timer == GameStatus.TIMER_DEATH:
+        return Phase.DYING
+
+    if game_state in GAME_OVER_STATES or in_game == GameStatus.NOT_IN_GAME:
+        return Phase.GAME_OVER
+
+    if game_state in TITLE_STATES:
+        return Phase.TITLE
+
+    if game_state in TRANSITION_STATES:
+        return Phase.TRANSITION
+
+    return Phase.PLAYING if world in WORLD_TILES else Phase.BOOT
+
+
+def is_interactive(phase: int) -> bool:
+    """True when the game reads the inputs of the agent"""
+    return phase == Phase.PLAYING
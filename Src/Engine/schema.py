@@ -0,0 +1,164 @@
+# 17.10.26
+
+from typing import Callable, Dict, List, Tuple
+
+
+# Internal utilities
+from .offset import Offset, GameStatus
+
+
+# Variable
+MAX_GAP = 0x50          # Bytes we accept to read for free in order to merge two spans
+BLANK_TILE = 0x2C       # HUD tile used for empty digits
+
+# Memory regions of the Game Boy bus, a span never crosses one of them
+REGIONS = (0x0000, 0x8000, 0xA000, 0xC000, 0xE000, 0xFE00, 0xFF00, 0xFF80, 0x10000)
+
+
+# Decoders, they receive an int for 1 byte fields and a list of ints for wider fields
+def raw(value: int) -> int:
+    return value
+
+def bcd(value: int) -> int:
+    return (value >> 4) * 10 + (value & 0x0F)
+
+def flag(value: int) -> bool:
+    return value != 0
+
+def not_equals(expected: int) -> Callable[[int], bool]:
+    return lambda value: value != expected
+
+def enum(mapping: Dict[int, str], default: str = "Unknown") -> Callable[[int], str]:
+    return lambda value: mapping.get(value, default)
+
+def digits(values: List[int]) -> int:
+    number = 0
+    for value in values:
+        number *= 10
+        if value != BLANK_TILE:
+            number += value
+    return number
+
+
+def _region(address: int) -> int:
+    for i in range(len(REGIONS) - 1):
+        if address < REGIONS[i + 1]:
+            return i
+    raise ValueError(f"Address out of range: 0x{address:X}")
+
+
+class Field:
+    __slots__ = ('name', 'address', 'width', 'decoder')
+
+    def __init__(self, name: str, address: int, decoder: Callable = raw, width: int = 1):
+        self.name = name
+        self.address = address
+        self.decoder = decoder
+        self.width = width
+
+    @property
+    def end(self) -> int:
+        return self.address + self.width
+
+
+class MemorySchema:
+    def __init__(self, fields: List[Field], max_gap: int = MAX_GAP):
+        self.fields = fields
+        self.max_gap = max_gap
+        self.spans = self._compile()
+
+    def _compile(self) -> List[Tuple[int, int, List[Tuple]]]:
+        """Merge the fields into the smallest set of contiguous reads"""
+        groups = []
+        for field in sorted(self.fields, key=lambda f: f.address):
+            if _region(field.address) != _region(field.end - 1):
+                raise ValueError(f"Field {field.name} crosses a memory region")
+
+            if groups:
+                start, end, members = groups[-1]
+                if _region(field.address) == _region(start) and field.address - end <= self.max_gap:
+                    groups[-1] = (start, max(end, field.end), members + [field])
+                    continue
+
+            groups.append((field.address, field.end, [field]))
+
+        spans = []
+        for start, end, members in groups:
+            decoders = [(f.name, f.address - start, f.width, f.decoder) for f in members]
+            spans.append((start, end, decoders))
+
+        return spans
+
+    def read(self, memory) -> Dict:
+        state = {}
+
+        for start, end, decoders in self.spans:
+            block = memory[start:end]
+
+            for name, offset, width, decoder in decoders:
+                if width == 1:
+                    state[name] = decoder(block[offset])
+                else:
+                    state[name] = decoder(block[offset:offset + width])
+
+        return state
+
+
+GAME_STATE_SCHEMA = MemorySchema([
+
+    # Mario block
+    Field('mario_y', Offset.MARIO_Y_POS),
+    Field('mario_x', Offset.MARIO_X_POS),
+    Field('mario_pose', Offset.MARIO_POSE),
+    Field('level_block', Offset.LEVEL_BLOCK),
+    Field('jump_state', Offset.JUMP_STATE, enum({
+        0x00: "Not Jumping",
+        0x01: "Ascending",
+        0x02: "Descending"
+    })),
+    Field('y_speed', Offset.Y_SPEED),
+    Field('grounded', Offset.GROUNDED, flag),
+    Field('direction', Offset.DIRECTION, enum({0x20: "Left"}, "Right")),
+    Field('in_game', Offset.IN_GAME, not_equals(GameStatus.NOT_IN_GAME)),
+    Field('progress_block', Offset.LEVEL_PROGRESS),
+
+    # HUD block
+    Field('score', Offset.SCORE, digits, width=6),
+    Field('current_world', Offset.CURRENT_WORLD),
+    Field('current_stage', Offset.CURRENT_STAGE),
+    Field('starman_timer', Offset.STARMAN_TIMER),
+    Field('timer_hundreds', Offset.TIMER_HUNDREDS),
+    Field('timer_tens', Offset.TIMER_TENS),
+    Field('timer_ones', Offset.TIMER_ONES),
+
+    # Work RAM
+    Field('lives', Offset.LIVES, bcd),
+
+    # IO registers
+    Field('scroll_x', Offset.SCROLL_X),
+
+    # HRAM flags
+    Field('powerup_status', Offset.POWERUP_STATUS),
+    Field('hard_mode', Offset.HARD_MODE_FLAG, flag),
+    Field('powerup_status_timer', Offset.POWERUP_STATUS_TIMER),
+    Field('game_state', Offset.GAME_OVER),
+    Field('has_superball', Offset.HAS_SUPERBALL, flag),
+    Field('coins', Offset.COINS),
+    Field('level_scroll_x', Offset.LEVEL_SCROLL_X),
+])
+
+
+def absolute_x(state: Dict) -> int:
+    """Mario's X from the start of the level, in pixels"""
+    real_offset = (state['level_scroll_x'] - 7) % 16 or 16
+    return state['progress_block'] * 16 + real_offset + state['mario_x'] - 16
+
+
+def is_alive(state: Dict) -> bool:
+    if state['game_state'] in GameStatus.DEAD:
+        return False
+
+    if state['powerup_status_timer'] == GameStatus.TIMER_DEATH:
+        return False
+
+    return True
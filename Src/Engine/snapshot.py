@@ -0,0 +1,215 @@
+# 17.10.26
+
+from typing import Dict, List
+
+
+# External libraries
+import numpy as np
+
+
+# Internal utilities
+from .offset import GameStatus
+from .dataclass import Timer, ENTITY_COUNT, ENTITY_DTYPE
+from .enemy import enemy_name
+from .schema import is_alive
+from .collision import nearest_threat
+
+
+# Variable
+SCALE = 3                   # Rects are in the scale of the visualizer window
+PLAYER_FEATURES = 10
+ENEMY_FEATURES = 11
+
+
+class Player:
+    # Columns of GameStateSnapshot.player_state
+    X = 0
+    Y = 1
+    RECT_LEFT = 2
+    RECT_TOP = 3
+    RECT_WIDTH = 4
+    RECT_HEIGHT = 5
+    DIRECTION_RIGHT = 6
+    JUMPING = 7
+    GROUNDED = 8
+    STARMAN_TIMER = 9
+
+class Enemy:
+    # Columns of GameStateSnapshot.enemies_state
+    TYPE = 0
+    X = 1
+    Y = 2
+    GAP_X = 3           # Signed horizontal gap between the hitboxes of Mario and the entity, 0 if they overlap
+    GAP_Y = 4
+    HP = 5
+    POSE = 6
+    DISTANCE = 7
+    COLLISIONE = 8
+    CATEGORY = 9        # enemy.Category
+    DANGER = 10         # enemy.Danger
+
+
+class PositionView:
+    __slots__ = ('_buffer', '_x', '_y', '_scroll_x')
+
+    def __init__(self, buffer: np.ndarray, x: int, y: int, scroll_x=None):
+        self._buffer = buffer
+        self._x = x
+        self._y = y
+        self._scroll_x = scroll_x
+
+    @property
+    def x(self) -> int:
+        return int(self._buffer[self._x])
+
+    @property
+    def y(self) -> int:
+        return int(self._buffer[self._y])
+
+    @property
+    def scroll_x(self):
+        return self._scroll_x() if self._scroll_x else None
+
+
+class RectView:
+    __slots__ = ('_buffer', '_left')
+
+    def __init__(self, buffer: np.ndarray, left: int):
+        self._buffer = buffer
+        self._left = left
+
+    @property
+    def left(self) -> int:
+        return int(self._buffer[self._left])
+
+    @property
+    def top(self) -> int:
+        return int(self._buffer[self._left + 1])
+
+    @property
+    def width(self) -> int:
+        return int(self._buffer[self._left + 2])
+
+    @property
+    def height(self) -> int:
+        return int(self._buffer[self._left + 3])
+
+
+class BoxView:
+    """Rect interface over a [left, top, right, bottom) hitbox, in SCALE"""
+    __slots__ = ('_box',)
+
+    def __init__(self, box: np.ndarray):
+        self._box = box
+
+    left = property(lambda self: int(self._box[0]) * SCALE)
+    top = property(lambda self: int(self._box[1]) * SCALE)
+    width = property(lambda self: int(self._box[2] - self._box[0]) * SCALE)
+    height = property(lambda self: int(self._box[3] - self._box[1]) * SCALE)
+
+
+class PlayerView:
+    """Stessa interfaccia di LocalPlayer, letta dallo snapshot"""
+    __slots__ = ('_snapshot', 'position', 'rect')
+
+    def __init__(self, snapshot: 'GameStateSnapshot'):
+        self._snapshot = snapshot
+        self.position = PositionView(snapshot.player_state, Player.X, Player.Y, lambda: snapshot.state['scroll_x'])
+        self.rect = RectView(snapshot.player_state, Player.RECT_LEFT)
+
+    pose = property(lambda self: self._snapshot.state['mario_pose'])
+    direction = property(lambda self: self._snapshot.state['direction'])
+    jump_state = property(lambda self: self._snapshot.state['jump_state'])
+    speed_y = property(lambda self: self._snapshot.state['y_speed'])
+    grounded = property(lambda self: self._snapshot.state['grounded'])
+    starman_timer = property(lambda self: self._snapshot.state['starman_timer'])
+    powerup_status = property(lambda self: self._snapshot.state['powerup_status'])
+    hard_mode = property(lambda self: self._snapshot.state['hard_mode'])
+    powerup_status_timer = property(lambda self: self._snapshot.state['powerup_status_timer'])
+    has_superball = property(lambda self: self._snapshot.state['has_superball'])
+
+
+class GameView:
+    """Stessa interfaccia di LandGame, letta dallo snapshot"""
+    __slots__ = ('_snapshot',)
+
+    def __init__(self, snapshot: 'GameStateSnapshot'):
+        self._snapshot = snapshot
+
+    current_world = property(lambda self: self._snapshot.state['current_world'])
+    current_stage = property(lambda self: self._snapshot.state['current_stage'])
+    score = property(lambda self: self._snapshot.state['score'])
+    lives = property(lambda self: self._snapshot.state['lives'])
+    coins = property(lambda self: self._snapshot.state['coins'])
+    in_game = property(lambda self: self._snapshot.state['in_game'])
+    game_over = property(lambda self: self._snapshot.state['game_state'] == GameStatus.GAME_OVER)
+    is_alive = property(lambda self: is_alive(self._snapshot.state))
+    is_startup = property(lambda self: self._snapshot.state['game_state'] == GameStatus.STARTUP)
+
+    @property
+    def timer(self) -> Timer:
+        state = self._snapshot.state
+        return Timer(state['timer_hundreds'], state['timer_tens'], state['timer_ones'])
+
+
+class EntityView:
+    """Stessa interfaccia di Entity, letta da una riga dello snapshot"""
+    __slots__ = ('_row', '_features', 'position', 'rect')
+
+    def __init__(self, snapshot: 'GameStateSnapshot', index: int):
+        self._row = snapshot.entities[index]
+        self._features = snapshot.enemies_state[index]
+        self.position = PositionView(self._features, Enemy.X, Enemy.Y)
+        self.rect = BoxView(snapshot.boxes[index])
+
+    i_type = property(lambda self: int(self._row['i_type']))
+    hp = property(lambda self: int(self._row['hp']))
+    pose = property(lambda self: int(self._row['pose']))
+    distance = property(lambda self: float(self._row['distance']))
+    collisione = property(lambda self: bool(self._row['collisione']))
+    category = property(lambda self: int(self._features[Enemy.CATEGORY]))
+    danger = property(lambda self: int(self._features[Enemy.DANGER]))
+
+    @property
+    def type(self) -> str:
+        return enemy_name(self.i_type)
+
+
+class GameStateSnapshot:
+    """
+    Game state stored in preallocated buffers, filled in place by MarioLandMonitor.fill_snapshot.
+    player_state and enemies_state are the observation arrays, they are overwritten at every fill.
+    """
+    __slots__ = ('state', 'player_state', 'enemies_state', 'entities', 'enemy_count', 'mario_box', 'boxes',
+                 'player', 'game', '_enemy_views')
+
+    def __init__(self):
+        self.state: Dict = {}
+        self.player_state = np.zeros(PLAYER_FEATURES, dtype=np.float32)
+        self.enemies_state = np.zeros((ENTITY_COUNT, ENEMY_FEATURES), dtype=np.float32)
+        self.entities = np.zeros(ENTITY_COUNT, dtype=ENTITY_DTYPE)      # Active entities packed first
+        self.enemy_count = 0
+        self.mario_box = np.zeros(4, dtype=np.int32)                    # Hitbox [left, top, right, bottom)
+        self.boxes = np.zeros((ENTITY_COUNT, 4), dtype=np.int32)        # Hitbox of the active entities
+
+        self.player = PlayerView(self)
+        self.game = GameView(self)
+        self._enemy_views = [EntityView(self, i) for i in range(ENTITY_COUNT)]
+
+    @property
+    def enemies(self) -> List[EntityView]:
+        return self._enemy_views[:self.enemy_count]
+
+    @property
+    def active_entities(self) -> np.ndarray:
+        return self.entities[:self.enemy_count]
+
+    def nearest_threat(self, facing: int = None, max_distance: float = np.inf):
+        """
+        (index, edge distance) of the closest hazard among the active entities, (-1, inf) if none.
+        facing defaults to Mario's direction; pass 0 to look both ways.
+        """
+        if facing is None:
+            facing = 1 if self.state['direction'] == "Right" else -1
+        n = self.enemy_count
+        return nearest_threat(self.mario_box, self.boxes[:n], self.entities['i_type'][:n], facing, max_distance)
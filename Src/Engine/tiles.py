@@ -0,0 +1,35 @@
+# 17.10.26
+
+# External libraries
+import numpy as np
+
+
+# Variable
+TILE_ROWS = 16
+TILE_COLS = 20
+TILE_SHAPE = (TILE_ROWS, TILE_COLS, 1)
+HUD_ROWS = 2                # Tile rows above the game area (score, coins, timer)
+
+# The game area uses PyBoy's compressed mapping (classes 0..27), decoded entities are written
+# on top as ENEMY_TILE_BASE + entity type so that every enemy keeps its own id.
+# Types past the end of the vocabulary (never used by the game) share the last id
+ENEMY_TILE_BASE = 32
+TILE_VOCABULARY = 256
+
+
+def overlay_entities(grid: np.ndarray, entities: np.ndarray, scroll_x: int) -> np.ndarray:
+    """
+    Write the active entities (ENTITY_DTYPE rows) on the tile grid.
+    Entity coordinates are 1 pixel left and 2 pixels above the sprite, the grid follows the fine scroll.
+    """
+    if len(entities) == 0:
+        return grid
+
+    rows = (entities['y'].astype(np.int32) + 2) // 8 - HUD_ROWS
+    cols = (entities['x'].astype(np.int32) + 1 + (scroll_x & 7)) // 8
+    visible = (rows >= 0) & (rows < TILE_ROWS) & (cols >= 0) & (cols < TILE_COLS)
+
+    # Sum in int32: in uint8 the types from 0xE0 would wrap into the terrain classes
+    ids = np.minimum(entities['i_type'][visible].astype(np.int32) + ENEMY_TILE_BASE, TILE_VOCABULARY - 1)
+    grid[rows[visible], cols[visible], 0] = ids
+    return grid
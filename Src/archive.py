@@ -0,0 +1,111 @@
+# 17.10.26
+
+import io
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+# External libraries
+import numpy as np
+
+
+# Internal utilities
+from .Engine.schema import absolute_x
+
+
+# Variable
+Cell = Tuple[int, int, int]         # (world, stage, bucket di X assoluta)
+
+
+class ArchiveEntry:
+    __slots__ = ('state', 'score', 'steps', 'progress', 'visits', 'chosen')
+
+    def __init__(self, state: bytes, score: int, steps: int, progress: int):
+        self.state = state          # Save-state PyBoy compresso con zlib
+        self.score = score
+        self.steps = steps          # Step dall'inizio del livello per raggiungere la cella
+        self.progress = progress    # X assoluta in pixel
+        self.visits = 0
+        self.chosen = 0
+
+
+class CellArchive:
+    """
+    Archivio Go-Explore: un save-state per cella (world, stage, X assoluta / bucket_size).
+    Una cella viene sostituita solo da una traiettoria migliore (score più alto, o stesso score in meno step).
+    Al massimo capacity celle: si elimina, tra le eviction_window usate meno di recente, quella meno avanzata.
+    """
+    def __init__(self, capacity: int = 500, bucket_size: int = 32, eviction_window: int = 32, seed=None):
+        self.capacity = capacity
+        self.bucket_size = bucket_size
+        self.eviction_window = eviction_window
+        self.cells: 'OrderedDict[Cell, ArchiveEntry]' = OrderedDict()       # Ordine LRU
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(entry.state) for entry in self.cells.values())
+
+    def cell(self, state: Dict) -> Cell:
+        return (state['current_world'], state['current_stage'], absolute_x(state) // self.bucket_size)
+
+    def visit(self, cell: Cell):
+        entry = self.cells.get(cell)
+        if entry is not None:
+            entry.visits += 1
+
+    def wants(self, cell: Cell, score: int, steps: int) -> bool:
+        """True se la cella è nuova o se questa traiettoria è migliore di quella salvata"""
+        entry = self.cells.get(cell)
+        if entry is None:
+            return True
+        return score > entry.score or (score == entry.score and steps < entry.steps)
+
+    def add(self, cell: Cell, save_state: bytes, score: int, steps: int, progress: int):
+        entry = self.cells.get(cell)
+        new = ArchiveEntry(zlib.compress(save_state, 1), score, steps, progress)
+
+        if entry is not None:
+            new.visits, new.chosen = entry.visits, entry.chosen
+        elif len(self.cells) >= self.capacity:
+            self._evict()
+
+        self.cells[cell] = new
+        self.cells.move_to_end(cell)
+
+    def _evict(self):
+        window = []
+        for cell, entry in self.cells.items():
+            window.append((entry.progress, cell))
+            if len(window) >= self.eviction_window:
+                break
+
+        del self.cells[min(window)[1]]
+
+    def select(self) -> Optional[Tuple[Cell, ArchiveEntry]]:
+        """Cella da cui ripartire: preferite quelle poco scelte, poco visitate e più avanti nel livello"""
+        if not self.cells:
+            return None
+
+        cells = list(self.cells)
+        entries = list(self.cells.values())
+        chosen = np.fromiter((entry.chosen for entry in entries), dtype=np.float64, count=len(entries))
+        visits = np.fromiter((entry.visits for entry in entries), dtype=np.float64, count=len(entries))
+        progress = np.fromiter((entry.progress for entry in entries), dtype=np.float64, count=len(entries))
+
+        weights = 1.0 / np.sqrt(chosen + 1.0) + 1.0 / np.sqrt(visits + 1.0) + progress / max(progress.max(), 1.0)
+        index = self.rng.choice(len(entries), p=weights / weights.sum())
+
+        cell, entry = cells[index], entries[index]
+        entry.chosen += 1
+        self.cells.move_to_end(cell)
+        return cell, entry
+
+    @staticmethod
+    def restore(entry: ArchiveEntry) -> io.BytesIO:
+        """Save-state decompresso, pronto per pyboy.load_state"""
+        return io.BytesIO(zlib.decompress(entry.state))
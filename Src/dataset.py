@@ -0,0 +1,290 @@
+# 17.10.26
+
+import os
+import json
+import queue
+import threading
+from typing import Dict, Iterator
+
+
+# External libraries
+import numpy as np
+
+
+# Internal utilities
+from .environment import observation_specs
+from .frames import gather_stacks
+
+
+# Variable
+MANIFEST = 'manifest.json'
+VERSION = 3                 # 2: colonne di enemies_state con gap, categoria e pericolosità; 3: un frame per riga
+
+# Colonne di ogni shard oltre alle osservazioni; valid[i]: la riga i è l'inizio di una transizione (next in i + 1);
+# prev[i]: riga del frame precedente dello stesso episodio nello shard, -1 al primo frame
+TRANSITION_FIELDS = {
+    'action': ((), np.int8),
+    'reward': ((), np.float32),
+    'done': ((), np.bool_),
+    'valid': ((), np.bool_),
+    'prev': ((), np.int32),
+}
+STATE_FIELDS = ('player_state', 'enemies_state')          # Oltre all'ultimo frame dell'immagine
+
+
+class DatasetWriter:
+    """
+    Scrive transizioni su disco in shard di shard_size righe, un file .npy per colonna.
+    Come nel ReplayBuffer ogni osservazione è salvata una volta sola, con il solo ultimo frame dello stack:
+    il next_state della riga i è la riga i + 1 e lo stack viene ricostruito in lettura dai puntatori prev.
+    Uno shard aperto a metà episodio inizia con righe di contesto (non valide) con i frame precedenti dello stack.
+    Il manifest viene riscritto alla chiusura di ogni shard, così un dataset parziale è già leggibile.
+    """
+    def __init__(self, path: str, observation: str = 'pixels', shard_size: int = 16384):
+        self.path = path
+        self.shard_size = shard_size
+        specs = observation_specs(observation)
+        image_shape, image_dtype = specs['image']
+        self.frame_stack = image_shape[-1]
+        if shard_size < self.frame_stack + 1:
+            raise ValueError(f"Shard size must be at least {self.frame_stack + 1} rows")
+        self.fields = dict(specs, image=(image_shape[:-1], image_dtype), **TRANSITION_FIELDS)
+        self.manifest = {
+            'version': VERSION,
+            'observation': observation,
+            'frame_stack': self.frame_stack,
+            'shard_size': shard_size,
+            'fields': {name: [list(shape), np.dtype(dtype).str] for name, (shape, dtype) in self.fields.items()},
+            'shards': [],
+        }
+
+        os.makedirs(path, exist_ok=True)
+        self._arrays = None
+        self._rows = 0
+        self._transitions = 0
+        self._last_next = None
+
+    def __len__(self) -> int:
+        return sum(shard['transitions'] for shard in self.manifest['shards']) + self._transitions
+
+    def _shard_name(self) -> str:
+        return f"shard_{len(self.manifest['shards']):05d}"
+
+    def _open_shard(self):
+        directory = os.path.join(self.path, self._shard_name())
+        os.makedirs(directory, exist_ok=True)
+        self._arrays = {
+            name: np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode='w+', dtype=dtype,
+                                            shape=(self.shard_size,) + tuple(shape))
+            for name, (shape, dtype) in self.fields.items()
+        }
+        self._rows = 0
+        self._transitions = 0
+        self._last_next = None
+
+    def _close_shard(self):
+        if self._arrays is None:
+            return
+
+        name, rows = self._shard_name(), self._rows
+        arrays, self._arrays = self._arrays, None
+        for field in list(arrays):
+            array = arrays.pop(field)
+            array.flush()
+            if rows < self.shard_size:
+                # Ultimo shard: riscritto con le sole righe usate, dopo aver chiuso la mappa
+                data = np.array(array[:rows])
+                del array
+                np.save(os.path.join(self.path, name, f"{field}.npy"), data)
+
+        self.manifest['shards'].append({'name': name, 'rows': rows, 'transitions': self._transitions})
+        self._transitions = 0
+        self._write_manifest()
+
+    def _write_manifest(self):
+        with open(os.path.join(self.path, MANIFEST), 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+    def _write_state(self, state: Dict, prev: int = -1) -> int:
+        index = self._rows
+        for name in STATE_FIELDS:
+            self._arrays[name][index] = state[name]
+        self._arrays['image'][index] = state['image'][..., -1]
+        self._arrays['prev'][index] = prev
+        self._rows += 1
+        return index
+
+    def _write_context(self, state: Dict) -> int:
+        """Righe con i frame dello stack che precedono l'ultimo, escluse le ripetizioni del primo frame"""
+        image = state['image']
+        start = 0
+        while start < self.frame_stack - 1 and np.array_equal(image[..., start + 1], image[..., 0]):
+            start += 1
+
+        prev = -1
+        for i in range(start, self.frame_stack - 1):
+            index = self._rows
+            self._arrays['image'][index] = image[..., i]
+            self._arrays['prev'][index] = prev
+            prev = index
+            self._rows += 1
+        return prev
+
+    def add(self, state: Dict, action: int, reward: float, next_state: Dict, done: bool):
+        """Stessa interfaccia di ReplayBuffer.add; gli array vengono copiati subito"""
+        chained = self._arrays is not None and self._rows > 0 and state is self._last_next
+        if chained and self._rows < self.shard_size:
+            # Lo stato è il next della transizione precedente, già scritto nell'ultima riga
+            index = self._rows - 1
+        else:
+            index = None
+            if self._arrays is not None and self._rows + 2 > self.shard_size:
+                self._close_shard()
+
+        if self._arrays is None:
+            self._open_shard()
+        if index is None:
+            # Continuazione di un episodio in un nuovo shard: la storia dello stack va riscritta
+            index = self._write_state(state, self._write_context(state) if chained else -1)
+
+        self._arrays['action'][index] = action
+        self._arrays['reward'][index] = reward
+        self._arrays['done'][index] = done
+        self._arrays['valid'][index] = True
+        self._write_state(next_state, index)
+
+        self._transitions += 1
+        self._last_next = next_state
+
+    def close(self):
+        self._close_shard()
+        self._write_manifest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TransitionDataset:
+    """
+    Dataset scritto da DatasetWriter, letto con np.load(mmap_mode='r'): le pagine vengono caricate solo quando
+    servono e sono condivise tramite page cache tra tutti i processi che aprono lo stesso dataset.
+    sample() ha la stessa interfaccia di ReplayBuffer.sample, quindi il dataset può sostituire agent.memory.
+    """
+    def __init__(self, path: str, seed=None):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('version') != VERSION:
+            raise ValueError(f"Dataset version {self.manifest.get('version')} is not supported (expected {VERSION}), "
+                             f"rebuild it with build_dataset.py")
+
+        self.observation = self.manifest['observation']
+        self.frame_stack = self.manifest['frame_stack']
+        self.shards = []
+        for shard in self.manifest['shards']:
+            directory = os.path.join(path, shard['name'])
+            arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+                      for name in self.manifest['fields']}
+            self.shards.append(arrays)
+
+        # Righe valide per shard: sono l'unica parte del dataset tenuta in memoria (4 byte per transizione)
+        self.valid_rows = [np.flatnonzero(arrays['valid']).astype(np.int32) for arrays in self.shards]
+        counts = np.array([len(rows) for rows in self.valid_rows], dtype=np.float64)
+        self.size = int(counts.sum())
+        self.shard_p = counts / counts.sum() if self.size else counts
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def gather(self, shard: int, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        arrays = self.shards[shard]
+        next_rows = rows + 1
+        return {
+            'image': gather_stacks(arrays['image'], arrays['prev'], rows, self.frame_stack),
+            'player_state': arrays['player_state'][rows],
+            'enemies_state': arrays['enemies_state'][rows],
+            'action': arrays['action'][rows].astype(np.int32),
+            'reward': arrays['reward'][rows],
+            'next_image': gather_stacks(arrays['image'], arrays['prev'], next_rows, self.frame_stack),
+            'next_player_state': arrays['player_state'][next_rows],
+            'next_enemies_state': arrays['enemies_state'][next_rows],
+            'done': arrays['done'][rows],
+        }
+
+    def sample(self, batch_size: int) -> Dict[str, np.ndarray]:
+        """Batch uniforme su tutte le transizioni: shard scelti in proporzione alla loro dimensione"""
+        shard_counts = self.rng.multinomial(batch_size, self.shard_p)
+        parts = []
+        for shard, count in enumerate(shard_counts):
+            if count:
+                # Righe ordinate: letture sequenziali sulle pagine mappate
+                rows = np.sort(self.rng.choice(self.valid_rows[shard], count))
+                parts.append(self.gather(shard, rows))
+
+        if len(parts) == 1:
+            return parts[0]
+        return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+    def batches(self, batch_size: int, shuffle: bool = True) -> Iterator[Dict[str, np.ndarray]]:
+        """Un'epoca completa, uno shard alla volta: la memoria usata resta quella di uno shard"""
+        order = self.rng.permutation(len(self.shards)) if shuffle else range(len(self.shards))
+        for shard in order:
+            rows = self.valid_rows[shard]
+            if shuffle:
+                rows = self.rng.permutation(rows)
+            for start in range(0, len(rows), batch_size):
+                yield self.gather(shard, np.sort(rows[start:start + batch_size]))
+
+
+class DatasetSampler:
+    """
+    Campiona batch dal dataset in un thread in background, prefetch batch alla volta.
+    Espone sample e __len__ come ReplayBuffer: agent.memory = DatasetSampler(...) per il training offline.
+    """
+    def __init__(self, dataset: TransitionDataset, batch_size: int, prefetch: int = 4):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=prefetch)
+        self.error = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                batch = self.dataset.sample(self.batch_size)
+                while not self._stop_event.is_set():
+                    try:
+                        self.queue.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as e:
+            self.error = e
+            raise
+
+    def sample(self, batch_size: int) -> Dict[str, np.ndarray]:
+        if batch_size != self.batch_size:
+            raise ValueError(f"Sampler batch size is {self.batch_size}, got {batch_size}")
+        while True:
+            # Attesa a intervalli: se il thread si ferma per un errore il chiamante non resta bloccato
+            if self.error is not None:
+                raise self.error
+            if not self._thread.is_alive() and self.queue.empty():
+                raise RuntimeError("Dataset sampler thread is not running")
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
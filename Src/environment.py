@@ -0,0 +1,438 @@
+# 17.10.26
+
+import io
+import random
+
+import gym
+import numpy as np
+from pyboy import PyBoy
+from pyboy.utils import WindowEvent
+
+
+# Internal utilities
+from .Engine.engine import MarioLandMonitor
+from .Engine.offset import Offset, GameStatus
+from .Engine.phase import Phase, is_interactive
+from .Engine.schema import absolute_x
+from .Engine.dataclass import ENTITY_COUNT
+from .Engine.snapshot import GameStateSnapshot, Enemy, PLAYER_FEATURES, ENEMY_FEATURES
+from .Engine.tiles import TILE_SHAPE
+from .frames import FrameStack, FRAME_SHAPE
+from .macro import Hold, Macro, MacroEngine
+from .archive import CellArchive
+from .stages import StageLibrary
+from .timing import NULL_TIMER
+from .rewards import RewardPipeline, RewardContext
+
+
+# Variable
+emulate_speed = 20
+fast_forward_limit = 3000     # Frame massimi saltati di fila (la schermata di game over ne dura circa 340)
+stage_check_frames = 8        # Frame avanzati dopo il caricamento di uno stage prima di verificarlo
+JUMP_ACTIONS = (3, 4)
+
+# Forma e dtype di ogni osservazione restituita da MarioEnvironment
+OBSERVATION_SPECS = {
+    'image': (FRAME_SHAPE, np.uint8),
+    'player_state': ((PLAYER_FEATURES,), np.float32),
+    'enemies_state': ((ENTITY_COUNT, ENEMY_FEATURES), np.float32),
+}
+
+# Modalità 'tiles': al posto dei frame una griglia di tile id della game area, senza render
+TILE_OBSERVATION_SPECS = dict(OBSERVATION_SPECS, image=(TILE_SHAPE, np.uint8))
+
+
+def observation_specs(observation='pixels'):
+    if observation not in ('pixels', 'tiles'):
+        raise ValueError(f"Unknown observation mode: {observation}")
+    return TILE_OBSERVATION_SPECS if observation == 'tiles' else OBSERVATION_SPECS
+
+
+class MarioEnvironment(gym.Env):
+    def __init__(self, rom_path, headless=False, fast_reset=False, noop_max=0, observation='pixels', frame_skip=1,
+                 archive_size=0, archive_reset_prob=0.5, stage_library=None, stage_weights=None, timer=None,
+                 reward_config=None):
+        super().__init__()
+        self.rom_path = rom_path
+        self.observation = observation
+        self.observation_specs = observation_specs(observation)
+        self.frame_skip = frame_skip      # Durata minima in frame di ogni azione
+
+        # Fast reset: il primo inizio livello viene salvato in memoria e ripristinato ad ogni reset,
+        # seguito da 0..noop_max frame senza input per variare la partenza
+        self.fast_reset = fast_reset
+        self.noop_max = noop_max
+        self._start_state = None
+
+        # Archivio Go-Explore (archive_size > 0): save-state per cella di avanzamento nel livello,
+        # con probabilità archive_reset_prob il reset riparte da una cella scelta dall'archivio
+        self.archive = CellArchive(archive_size) if archive_size > 0 else None
+        self.archive_reset_prob = archive_reset_prob
+        self._archive_buffer = io.BytesIO()
+        self._level_steps = 0
+
+        # Libreria di stage (file creato da build_stages.py): ogni reset parte dall'inizio di uno stage
+        # scelto con i pesi stage_weights, es. {'2-3': 1, '4-2': 2}; senza pesi la scelta è uniforme
+        self.stages = StageLibrary.load(stage_library) if stage_library else None
+        self.stage_weights = stage_weights
+        self.start_stage = None
+        if self.stages is not None:
+            self.stages.probabilities(stage_weights)      # Valida i pesi subito
+
+        # Reward come somma pesata di termini (rewards.DEFAULT_REWARD_CONFIG), valori per termine in info
+        self.rewards = RewardPipeline(reward_config)
+        self._reward_context = RewardContext()
+
+        # Tempi per stage di step/reset (StageTimer); il NullTimer non legge nemmeno il clock
+        self.timer = timer or NULL_TIMER
+
+        # Headless: nessuna finestra, niente audio, velocità illimitata e render solo dei frame osservati
+        self.headless = headless
+        self.emulation_speed = 0 if headless else emulate_speed
+
+        # Ultimi frame osservati; un frame entra nello stack solo se è stato renderizzato dopo l'ultima osservazione
+        self.frames = FrameStack()
+        self._frame_ready = False
+
+        # Griglie della modalità tiles, alternate come gli snapshot del monitor
+        self._tile_grids = [np.zeros(TILE_SHAPE, dtype=np.uint8) for _ in range(2)]
+        self._tile_index = 0
+        self._create_pyboy()
+        
+        self.action_space = gym.spaces.Discrete(5)
+        #self.observation_space = gym.spaces.Box(low=0, high=255, shape=(84, 84, 1), dtype=np.uint8)
+
+        # Aumentiamo lo state space per includere:
+        # - Ultimi FRAME_STACK frame processati (84x84xk, uint8: la normalizzazione è nel modello)
+        # - Informazioni del giocatore (9 features)
+        # - Informazioni dei nemici (5 features per nemico, max 10 nemici)
+        self.observation_space = gym.spaces.Dict({
+            'image': gym.spaces.Box(low=0, high=255, shape=self.observation_specs['image'][0], dtype=np.uint8),
+            'player_state': gym.spaces.Box(low=-np.inf, high=np.inf, shape=(PLAYER_FEATURES,), dtype=np.float32),
+            'enemies_state': gym.spaces.Box(low=-np.inf, high=np.inf, shape=(ENTITY_COUNT, ENEMY_FEATURES), dtype=np.float32)
+        })
+        
+        self.screen_dims = self.pyboy.screen.raw_buffer_dims
+        self.inactivity_episodes = 0
+        self.consecutive_stuck_episodes = 0
+        self.long_jump_mode = False
+        
+        # Ogni azione è una timeline di tasti (frame di inizio, durata); durata None = movimento continuo
+        self.actions = {
+            0: Macro(),                                                 # No action
+            1: Macro([Hold('right')]),                                  # Continuous right movement
+            2: Macro([Hold('left')]),                                   # Continuous left movement
+            3: Macro([Hold('a', 0, 1)]),                                # Normal jump
+            4: Macro([Hold('right', 0, 2), Hold('a', 1, 1)])            # Jump + Right
+        }
+
+        # Salti lunghi: A tenuto premuto per 20 frame
+        self.long_jump_actions = {
+            3: Macro([Hold('a', 0, 20)]),
+            4: Macro([Hold('a', 0, 20), Hold('right', 0, 20)])
+        }
+        
+        self.last_position = 0
+        self.last_score = 0
+        self.stuck_counter = 0
+        self.max_steps_per_level = 2000
+        self.current_steps = 0
+        self.was_alive = True
+
+    def _create_pyboy(self):
+        if self.headless:
+            self.pyboy = PyBoy(self.rom_path, window="null", sound_emulated=False, debug=False)
+        else:
+            self.pyboy = PyBoy(self.rom_path, window="SDL2", debug=False)
+
+        self.monitor = MarioLandMonitor(self.pyboy)
+        self.pyboy.set_emulation_speed(self.emulation_speed)
+        self.macros = MacroEngine(self.pyboy, self._tick, self.monitor._is_alive, frame_skip=self.frame_skip)
+
+        # Vista persistente sul canale 0 dello schermo RGBA di PyBoy
+        self._screen = self.pyboy.screen.ndarray[:, :, 0]
+
+        if self.observation == 'tiles':
+            self.pyboy.game_area_mapping(self.pyboy.game_wrapper.mapping_compressed, 0)
+
+    def _tick(self, count=1, render=False):
+        """Avanza di count frame; in headless renderizza solo se il frame diventa un'osservazione"""
+        if self.headless:
+            # In modalità tiles lo schermo non viene mai renderizzato
+            render = render and self.observation == 'pixels'
+            self.pyboy.tick(count, render, False)
+            self._frame_ready |= render
+        else:
+            for _ in range(count):
+                self.pyboy.tick()
+            self._frame_ready = True
+
+    def get_state(self, snapshot: GameStateSnapshot):
+        """Combina tutti gli stati in un dizionario (gli array sono viste sullo snapshot)"""
+        if self.observation == 'tiles':
+            image = self.tile_grid(snapshot)
+        else:
+            image = self.preprocess_frame()
+
+        return {
+            'image': image,
+            'player_state': snapshot.player_state,
+            'enemies_state': snapshot.enemies_state
+        }
+    
+    def _skip_phases(self, stop_on_death=True) -> int:
+        """
+        Avanza senza render né osservazioni finché il gioco non è giocabile (boot, titolo, animazione di morte,
+        inizio livello, game over); preme START sulla schermata iniziale. Restituisce i frame saltati.
+        Con stop_on_death la morte non viene saltata: è la fine dell'episodio.
+        """
+        skipped = 0
+        phase = self.monitor.phase()
+        if is_interactive(phase) or (stop_on_death and phase == Phase.DYING):
+            return 0
+
+        # Nessun tasto resta premuto durante le fasi saltate
+        self.macros.release_all()
+        self.pyboy.set_emulation_speed(0)
+
+        while not (is_interactive(phase) or (stop_on_death and phase == Phase.DYING)):
+            if skipped >= fast_forward_limit:
+                raise RuntimeError(f"Still in phase {Phase.NAMES[phase]} (game state "
+                                   f"{self.pyboy.memory[Offset.GAME_OVER]}) after {skipped} skipped frames")
+
+            start = self.pyboy.memory[Offset.GAME_OVER] == GameStatus.STARTUP
+            if start:
+                self.pyboy.send_input(WindowEvent.PRESS_BUTTON_START)
+            self.pyboy.tick(1, False, False)
+            if start:
+                self.pyboy.send_input(WindowEvent.RELEASE_BUTTON_START)
+
+            skipped += 1
+            phase = self.monitor.phase()
+
+        self.pyboy.set_emulation_speed(self.emulation_speed)
+        return skipped
+
+    def preprocess_frame(self, reset=False):
+        """Stack dei frame come vista uint8; senza un nuovo frame renderizzato non copia nulla"""
+        if reset:
+            self.frames.reset(self._screen)
+        elif self._frame_ready:
+            self.frames.push(self._screen)
+
+        self._frame_ready = False
+        return self.frames.observation
+        
+    def tile_grid(self, snapshot: GameStateSnapshot):
+        """Griglia (16, 20, 1) uint8 dei tile id con i nemici sovrapposti; resta valida fino allo step successivo"""
+        self._tile_index ^= 1
+        return self.monitor.fill_tile_grid(self._tile_grids[self._tile_index], snapshot)
+        
+    def is_alive(self):
+        return self.monitor._is_alive()
+        
+    def step(self, action):
+        timer = self.timer
+        begin = start = timer.start()
+        self.current_steps += 1
+        self._level_steps += 1
+        
+        # Esegue la timeline dell'azione (in modalità long_jump i salti tengono premuto A più a lungo);
+        # la macro si interrompe se Mario muore a metà
+        macro = self.long_jump_actions.get(action) if self.long_jump_mode else None
+        self.macros.run(macro or self.actions[action])
+
+        # Fine livello e altre fasi non giocabili vengono saltate senza render: non arrivano all'agente
+        skipped = self._skip_phases()
+        if skipped:
+            self._tick(render=True)
+        start = timer.lap('step.emulation', start)
+        
+        # Ottieni nuovo stato (decodificato una sola volta per frame)
+        snapshot = self.monitor.snapshot()
+        start = timer.lap('step.decode', start)
+        localPlayer, landGame = snapshot.player, snapshot.game
+        mario_x = localPlayer.position.x
+        mario_y = localPlayer.position.y
+        score = landGame.score
+        lives = landGame.lives
+        alive = landGame.is_alive
+        if skipped:
+            # Dopo le fasi saltate (fine livello) Mario riparte all'inizio di un nuovo livello
+            self.last_position = mario_x
+        x_progress = mario_x - self.last_position
+        
+        # Controlla se Mario è fermo
+        if abs(x_progress) < 1:
+            self.stuck_counter += 1
+        else:
+            self.stuck_counter = 0
+            
+        # Inattività: penalizzata dal termine 'inactivity'
+        stuck = self.stuck_counter > 600
+        if stuck:
+            self.inactivity_episodes += 1
+            self.consecutive_stuck_episodes += 1
+            print(f"Episode terminated due to inactivity! (Stuck episodes: {self.consecutive_stuck_episodes})")
+            
+            # Attiva la modalità long jump se troppi episodi consecutivi bloccati
+            if self.consecutive_stuck_episodes >= 3:
+                self.long_jump_mode = True
+                print("Activating long jump mode to overcome obstacles!")
+        else:
+            # Se completiamo un episodio senza bloccarci, resettiamo il contatore
+            self.consecutive_stuck_episodes = 0
+
+        # Reward dai termini configurati, calcolati sugli array dello snapshot
+        n = snapshot.enemy_count
+        context = self._reward_context
+        context.x_progress = x_progress
+        context.score_delta = score - self.last_score
+        context.mario_y = mario_y
+        context.jumped = action in JUMP_ACTIONS
+        context.long_jump_mode = self.long_jump_mode
+        context.stuck = stuck
+        context.alive = alive
+        context.distances = snapshot.enemies_state[:n, Enemy.DISTANCE]
+        context.collisions = snapshot.enemies_state[:n, Enemy.COLLISIONE]
+        context.threat_distance = snapshot.nearest_threat()[1]
+        reward, reward_terms = self.rewards(context)
+        
+        # La morte termina l'episodio
+        done = not alive
+        if alive and self.archive is not None:
+            self._update_archive(snapshot.state, score)
+            
+        self.last_position = mario_x
+        self.last_score = score
+        start = timer.lap('step.reward', start)
+
+        state = self.get_state(snapshot)
+        timer.lap('step.observation', start)
+        timer.lap('step.total', begin)
+
+        info = {
+            'x_pos': mario_x,
+            'y_pos': mario_y,
+            'score': score,
+            'lives': lives,
+            'steps': self.current_steps,
+            'is_alive': alive,
+            'stuck_time': self.stuck_counter,
+            'long_jump_mode': self.long_jump_mode,
+            'skipped_frames': skipped,
+            'reward_terms': reward_terms
+        }
+        if timer.enabled:
+            info['timings'] = timer.latest('step.')
+        return state, reward, done, info
+        
+    def reset_level(self):
+        """Reset completo del livello: salta animazione di morte, game over e titolo fino al primo frame giocabile"""
+        start = self.timer.start()
+        self._skip_phases(stop_on_death=False)
+        start = self.timer.lap('reset_level.skip_phases', start)
+        self._tick(render=True)
+        self.timer.lap('reset_level.render', start)
+
+        self.current_steps = 0
+        self.stuck_counter = 0
+        self.was_alive = True
+        self.last_position = 0
+        self.last_score = 0
+
+    def _capture_start_state(self):
+        """Salva lo stato del gioco se il livello è appena iniziato"""
+        if not is_interactive(self.monitor.phase()) or not self.is_alive():
+            return
+
+        self.macros.release_all()
+        self._start_state = io.BytesIO()
+        self.pyboy.save_state(self._start_state)
+
+    def _load_state(self, buffer, noops=0):
+        """Carica un save-state e avanza di 1 + noops frame, così lo schermo corrisponde allo stato"""
+        buffer.seek(0)
+        self.pyboy.load_state(buffer)
+        self.monitor.invalidate()
+        self.macros.reset()
+        self._tick(1 + noops, render=True)
+
+    def _restore_start_state(self):
+        """Ripristina lo stato salvato in tempo costante, più qualche no-op casuale"""
+        noops = random.randint(0, self.noop_max) if self.noop_max > 0 else 0
+        self._load_state(self._start_state, noops)
+
+    def _update_archive(self, state, score):
+        """Salva la cella corrente se è nuova o raggiunta con una traiettoria migliore"""
+        cell = self.archive.cell(state)
+        self.archive.visit(cell)
+
+        if self.monitor.phase() == Phase.PLAYING and self.archive.wants(cell, score, self._level_steps):
+            self._archive_buffer.seek(0)
+            self._archive_buffer.truncate()
+            self.pyboy.save_state(self._archive_buffer)
+            self.archive.add(cell, self._archive_buffer.getvalue(), score, self._level_steps, absolute_x(state))
+
+    def _restore_cell(self):
+        """Riparte da una cella della frontiera dell'archivio"""
+        cell, entry = self.archive.select()
+        self._load_state(self.archive.restore(entry))
+        self._level_steps = entry.steps
+
+    def _restore_stage(self):
+        """Riparte dall'inizio di uno stage della libreria"""
+        self.start_stage, state = self.stages.sample(self.stage_weights)
+        noops = random.randint(0, self.noop_max) if self.noop_max > 0 else 0
+        self._load_state(state, noops)
+        self.check_playable(self.start_stage)
+
+    def check_playable(self, label, frames=stage_check_frames):
+        """Avanza qualche frame senza input e verifica che il gioco legga gli input con Mario vivo"""
+        self._tick(frames, render=True)
+        phase = self.monitor.phase()
+        if not is_interactive(phase) or not self.is_alive():
+            raise RuntimeError(f"Stage {label} is not playable after {frames} frames: phase {Phase.NAMES[phase]}, "
+                               f"game state {self.pyboy.memory[Offset.GAME_OVER]}")
+
+    def reset(self):
+        begin = self.timer.start()
+        self._level_steps = 0
+
+        if self.archive and random.random() < self.archive_reset_prob:
+            self._restore_cell()
+        elif self.stages is not None:
+            self._restore_stage()
+        elif self.fast_reset and self._start_state is not None:
+            self._restore_start_state()
+        elif not hasattr(self, 'pyboy'):
+            self._create_pyboy()
+            self.reset_level()
+        else:
+            self.reset_level()
+            if self.fast_reset:
+                self._capture_start_state()
+        
+        self.current_steps = 0
+        self.stuck_counter = 0
+        self.was_alive = True
+
+        # Reset della modalità long jump solo se abbiamo completato con successo
+        if not self.consecutive_stuck_episodes >= 3:
+            self.long_jump_mode = False
+        
+        # Lo stack riparte dal frame corrente, senza frame dell'episodio precedente
+        if self.observation == 'pixels':
+            self.preprocess_frame(reset=True)
+
+        # Reward del primo step relativi al punto di partenza (lo score resta tra le vite e nelle celle salvate)
+        snapshot = self.monitor.snapshot()
+        self.last_position = snapshot.player.position.x
+        self.last_score = snapshot.game.score
+        state = self.get_state(snapshot)
+        self.timer.lap('reset.total', begin)
+        return state
+    
+    def close(self):
+        if hasattr(self, 'pyboy'):
+            self.pyboy.stop()
@@ -0,0 +1,82 @@
+# 17.10.26
+
+from typing import Tuple
+
+
+# External libraries
+import cv2
+import numpy as np
+
+
+# Variable
+FRAME_SIZE = 84
+FRAME_STACK = 4
+FRAME_SHAPE = (FRAME_SIZE, FRAME_SIZE, FRAME_STACK)
+
+
+class FrameStack:
+    """
+    Ultimi k frame in scala di grigi (uint8) in un buffer circolare preallocato.
+    Il ring ha k + 1 slot, i primi k - 1 duplicati in coda al buffer (2k piani in tutto): così gli ultimi k frame
+    sono sempre contigui e l'osservazione precedente resta valida fino al push successivo.
+    observation è una vista (size, size, k), dal frame più vecchio al più recente.
+    """
+    def __init__(self, k: int = FRAME_STACK, size: int = FRAME_SIZE):
+        self.k = k
+        self.slots = k + 1
+        self.size = size
+        self.planes = np.zeros((2 * k, size, size), dtype=np.uint8)
+        self.newest = k - 1
+
+        # Una vista channels-last per ogni possibile inizio della finestra, create una volta sola
+        self._views = [np.moveaxis(self.planes[start:start + k], 0, -1) for start in range(self.slots)]
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (self.size, self.size, self.k)
+
+    @property
+    def observation(self) -> np.ndarray:
+        return self._views[(self.newest - self.k + 1) % self.slots]
+
+    def _write(self, screen: np.ndarray, slot: int):
+        cv2.resize(screen, (self.size, self.size), dst=self.planes[slot], interpolation=cv2.INTER_AREA)
+
+        # Copia speculare per i slot che compaiono anche in coda al buffer
+        if slot < self.k - 1:
+            self.planes[slot + self.slots] = self.planes[slot]
+
+    def push(self, screen: np.ndarray) -> np.ndarray:
+        """Ridimensiona screen (grayscale, qualsiasi stride) direttamente nel buffer"""
+        self.newest = (self.newest + 1) % self.slots
+        self._write(screen, self.newest)
+        return self.observation
+
+    def reset(self, screen: np.ndarray) -> np.ndarray:
+        """Riempie lo stack con lo stesso frame, a inizio episodio"""
+        self._write(screen, 0)
+        self.planes[1:] = self.planes[0]
+        self.newest = self.k - 1
+        return self.observation
+
+
+def gather_stacks(frames: np.ndarray, prev: np.ndarray, indices: np.ndarray, k: int, linked=None) -> np.ndarray:
+    """
+    Ricostruisce gli stack (n, ..., k) che terminano con i frame in indices, risalendo i puntatori prev
+    (indice del frame precedente dello stesso episodio, -1 al primo frame). All'inizio dell'episodio
+    il primo frame viene ripetuto, come in FrameStack.reset.
+    linked(current, previous) -> maschera dei collegamenti ancora validi (es. slot non sovrascritti).
+    """
+    stack = np.empty((len(indices),) + frames.shape[1:] + (k,), dtype=frames.dtype)
+    current = np.asarray(indices, dtype=np.int64)
+    stack[..., k - 1] = frames[current]
+
+    for i in range(k - 2, -1, -1):
+        previous = prev[current].astype(np.int64)
+        ok = previous >= 0
+        if linked is not None:
+            ok[ok] = linked(current[ok], previous[ok])
+        current = np.where(ok, previous, current)
+        stack[..., i] = frames[current]
+
+    return stack
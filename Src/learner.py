@@ -0,0 +1,67 @@
+# 17.10.26
+
+import time
+import threading
+
+
+class AsyncLearner(threading.Thread):
+    """
+    Allena l'agente in un thread in background mentre il loop dell'ambiente continua a fare step.
+    replay_ratio è il numero di update per step dell'ambiente; i nuovi pesi della policy vengono
+    pubblicati ogni publish_interval update e letti dall'actor con agent.sync_actor().
+    """
+    def __init__(self, agent, batch_size, replay_ratio=0.25, publish_interval=50):
+        super().__init__(daemon=True)
+        self.agent = agent
+        self.batch_size = batch_size
+        self.replay_ratio = replay_ratio
+        self.publish_interval = publish_interval
+
+        self.env_steps = 0
+        self.updates = 0
+        self.error = None
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._start_time = None
+
+    def notify_step(self, count=1):
+        """Chiamato dall'actor dopo ogni step dell'ambiente, non blocca mai"""
+        self.env_steps += count
+        self._wakeup.set()
+
+    @property
+    def update_rate(self) -> float:
+        """Update al secondo dall'avvio del learner"""
+        if self._start_time is None:
+            return 0.0
+        return self.updates / max(time.time() - self._start_time, 1e-9)
+
+    def _can_update(self) -> bool:
+        if len(self.agent.memory) < self.batch_size:
+            return False
+        return self.updates < self.env_steps * self.replay_ratio
+
+    def run(self):
+        self._start_time = time.time()
+
+        try:
+            while not self._stop_event.is_set():
+                if not self._can_update():
+                    self._wakeup.wait(0.1)
+                    self._wakeup.clear()
+                    continue
+
+                self.agent.replay(self.batch_size)
+                self.updates += 1
+
+                if self.updates % self.publish_interval == 0:
+                    self.agent.publish_weights()
+
+        except Exception as e:
+            self.error = e
+            raise
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+        self.join()
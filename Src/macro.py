@@ -0,0 +1,143 @@
+# 17.10.26
+
+from typing import Callable, FrozenSet, List, Tuple
+
+
+# External libraries
+from pyboy.utils import WindowEvent
+
+
+# Variable
+BUTTONS = {
+    'right': (WindowEvent.PRESS_ARROW_RIGHT, WindowEvent.RELEASE_ARROW_RIGHT),
+    'left': (WindowEvent.PRESS_ARROW_LEFT, WindowEvent.RELEASE_ARROW_LEFT),
+    'up': (WindowEvent.PRESS_ARROW_UP, WindowEvent.RELEASE_ARROW_UP),
+    'down': (WindowEvent.PRESS_ARROW_DOWN, WindowEvent.RELEASE_ARROW_DOWN),
+    'a': (WindowEvent.PRESS_BUTTON_A, WindowEvent.RELEASE_BUTTON_A),
+    'b': (WindowEvent.PRESS_BUTTON_B, WindowEvent.RELEASE_BUTTON_B),
+}
+
+
+class Hold:
+    """Tasto premuto al frame start per frames frame; frames=None lo tiene premuto anche dopo la fine della macro"""
+    __slots__ = ('button', 'start', 'frames')
+
+    def __init__(self, button: str, start: int = 0, frames: int = None):
+        if button not in BUTTONS:
+            raise ValueError(f"Unknown button: {button}")
+        self.button = button
+        self.start = start
+        self.frames = frames
+
+    @property
+    def end(self):
+        return None if self.frames is None else self.start + self.frames
+
+
+class Macro:
+    """
+    Timeline dichiarativa di un'azione: un insieme di Hold su almeno length frame.
+    compile() la trasforma nei soli istanti in cui cambia l'insieme dei tasti premuti.
+    """
+    def __init__(self, holds: List[Hold] = (), length: int = 1):
+        self.holds = list(holds)
+        self.length = max([length] + [hold.end or hold.start + 1 for hold in self.holds])
+        self._compiled = {}
+
+    def pressed_at(self, frame: int) -> FrozenSet[str]:
+        return frozenset(
+            hold.button for hold in self.holds
+            if hold.start <= frame and (hold.end is None or frame < hold.end)
+        )
+
+    def compile(self, length: int) -> Tuple[FrozenSet[str], List[Tuple[int, Tuple, Tuple]]]:
+        """(tasti al frame 0, [(frame, press, release)]) per una durata di length frame, l'ultimo cambio è a length"""
+        if length not in self._compiled:
+            frames = sorted({hold.start for hold in self.holds} | {hold.end for hold in self.holds if hold.end is not None})
+            changes, previous = [], self.pressed_at(0)
+
+            for frame in frames:
+                if frame <= 0 or frame > length:
+                    continue
+
+                # Alla fine della macro si rilasciano i tasti a durata finita, i tasti continui restano premuti
+                current = self.pressed_at(frame) if frame < length else previous - {
+                    hold.button for hold in self.holds if hold.end == length
+                }
+                if current != previous:
+                    changes.append((frame, tuple(current - previous), tuple(previous - current)))
+                previous = current
+
+            if not changes or changes[-1][0] != length:
+                changes.append((length, (), ()))
+            self._compiled[length] = (self.pressed_at(0), changes)
+
+        return self._compiled[length]
+
+
+class MacroEngine:
+    """
+    Esegue le Macro su PyBoy: invia solo i cambi di stato dei tasti e avanza i frame senza input con una sola tick.
+    Ogni decisione dura almeno frame_skip frame; span più lunghi di probe_interval vengono spezzati e dopo ogni
+    pezzo probe() (lettura RAM) può interrompere la macro, es. alla morte di Mario.
+    """
+    def __init__(self, pyboy, tick: Callable[[int, bool], None], probe: Callable[[], bool] = None,
+                 frame_skip: int = 1, probe_interval: int = 4):
+        self.pyboy = pyboy
+        self.tick = tick
+        self.probe = probe
+        self.frame_skip = frame_skip
+        self.probe_interval = probe_interval
+        self.held = set()
+
+    def _apply(self, press, release):
+        for button in release:
+            self.pyboy.send_input(BUTTONS[button][1])
+            self.held.discard(button)
+        for button in press:
+            self.pyboy.send_input(BUTTONS[button][0])
+            self.held.add(button)
+
+    def release_all(self):
+        self._apply((), tuple(self.held))
+
+    def reset(self):
+        """Rilascia ogni tasto: dopo un load_state lo stato del joypad non corrisponde a held"""
+        self.held = set(BUTTONS)
+        self.release_all()
+
+    def _advance(self, frames: int, last: bool) -> bool:
+        """Avanza di frames frame, renderizzando l'ultimo se last; False se probe interrompe"""
+        if self.probe is None or frames <= self.probe_interval:
+            self.tick(frames, last)
+            return True
+
+        done = 0
+        while done < frames:
+            count = min(frames - done, self.probe_interval)
+            done += count
+            self.tick(count, last and done == frames)
+
+            if done < frames and not self.probe():
+                # Un frame in più, renderizzato, perché l'osservazione finale corrisponda alla RAM
+                self.tick(1, True)
+                return False
+
+        return True
+
+    def run(self, macro: Macro) -> bool:
+        """Esegue macro; False se è stata interrotta da probe"""
+        length = max(macro.length, self.frame_skip)
+        start, changes = macro.compile(length)
+        self._apply(tuple(start - self.held), tuple(self.held - start))
+
+        frame = 0
+        for at, press, release in changes:
+            if at > frame:
+                if not self._advance(at - frame, at == length):
+                    self.release_all()
+                    return False
+                frame = at
+            self._apply(press, release)
+
+        return True
@@ -1,17 +1,26 @@
 import random
 import numpy as np
-from collections import deque
+import tensorflow as tf
 from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Conv2D, Dense, Flatten, Input, concatenate
+from tensorflow.keras.layers import Conv2D, Dense, Embedding, Flatten, Input, Rescaling, Reshape, concatenate
+from tensorflow.keras.losses import Huber
 from tensorflow.keras.optimizers import Adam
 
 
+# Internal utilities
+from .Engine.dataclass import ENTITY_COUNT
+from .Engine.snapshot import PLAYER_FEATURES, ENEMY_FEATURES
+from .Engine.tiles import TILE_SHAPE, TILE_VOCABULARY
+from .frames import FRAME_SHAPE
+from .replay import ReplayBuffer, PrioritizedReplayBuffer
+from .timing import NULL_TIMER
+
 
 class EnhancedDQNAgent:
-    def __init__(self, action_size):
+    def __init__(self, action_size, memory_size=50000, prioritized=False, observation='pixels', timer=None):
         # Parametri base
         self.action_size = action_size
-        self.memory = deque(maxlen=50000)
+        self.observation = observation  # 'pixels' (stack di frame) o 'tiles' (griglia di tile id)
         
         # Parametri di learning
         self.gamma = 0.95  # discount rate
@@ -22,26 +31,49 @@ class EnhancedDQNAgent:
         self.tau = 0.001  # Per soft update del target network
         
         # Dimensioni degli input
-        self.image_shape = (84, 84, 1)
-        self.player_state_size = 9
-        self.enemy_state_size = (5, 5)  # 5 nemici max, 5 features per nemico
+        self.image_shape = TILE_SHAPE if observation == 'tiles' else FRAME_SHAPE  # uint8
+        self.player_state_size = PLAYER_FEATURES
+        self.enemy_state_size = (ENTITY_COUNT, ENEMY_FEATURES)  # 10 slot entità, 11 features per nemico
+
+        # Replay buffer preallocato (frame uint8, features float32, azioni int8), opzionalmente prioritizzato
+        self.prioritized = prioritized
+        buffer_class = PrioritizedReplayBuffer if prioritized else ReplayBuffer
+        self.memory = buffer_class(memory_size, self.image_shape, self.player_state_size, self.enemy_state_size)
         
         # Reti neurali
         self.model = self._build_model()
         self.target_model = self._build_model()
+        self.optimizer = Adam(learning_rate=self.learning_rate)
         self.align_target_model()
 
+        # Rete usata da act: coincide con model, o è una copia separata aggiornata con publish/sync
+        # quando il training gira in un thread a parte
+        self.policy_model = self.model
+        self._published_weights = None
+
+        # Tempi per stage di act/replay (StageTimer), condivisibile con l'ambiente
+        self.timer = timer or NULL_TIMER
+
+        # Inferenza: funzione compilata sulla policy, input preallocati per il caso a singolo ambiente,
+        # oppure un interprete TFLite caricato con load_tflite
+        self._policy_fn = None
+        self._tflite = None
+        self._act_inputs = (
+            np.zeros((1,) + self.image_shape, dtype=np.uint8),
+            np.zeros((1, self.player_state_size), dtype=np.float32),
+            np.zeros((1,) + self.enemy_state_size, dtype=np.float32)
+        )
+
     def _build_model(self):
         # Input layers
-        image_input = Input(shape=self.image_shape, name='image_input')
+        image_input = Input(shape=self.image_shape, dtype='uint8', name='image_input')
         player_input = Input(shape=(self.player_state_size,), name='player_input')
         enemy_input = Input(shape=self.enemy_state_size, name='enemy_input')
         
-        # CNN per processare l'immagine
-        conv1 = Conv2D(32, (8, 8), strides=(4, 4), activation='relu')(image_input)
-        conv2 = Conv2D(64, (4, 4), strides=(2, 2), activation='relu')(conv1)
-        conv3 = Conv2D(64, (3, 3), strides=(1, 1), activation='relu')(conv2)
-        conv_flat = Flatten()(conv3)
+        if self.observation == 'tiles':
+            conv_flat = self._tile_tower(image_input)
+        else:
+            conv_flat = self._pixel_tower(image_input)
         
         # Dense network per processare lo stato del player
         player_dense = Dense(64, activation='relu')(player_input)
@@ -60,39 +92,175 @@ class EnhancedDQNAgent:
         
         model = Model(inputs=[image_input, player_input, enemy_input], 
                      outputs=output)
-        model.compile(loss='huber_loss', optimizer=Adam(learning_rate=self.learning_rate))
+        model.compile(loss=Huber(), optimizer=Adam(learning_rate=self.learning_rate))
         
         return model
 
+    def _pixel_tower(self, image_input):
+        # CNN per processare l'immagine (i frame arrivano uint8, normalizzati qui)
+        scaled = Rescaling(1.0 / 255.0)(image_input)
+        conv1 = Conv2D(32, (8, 8), strides=(4, 4), activation='relu')(scaled)
+        conv2 = Conv2D(64, (4, 4), strides=(2, 2), activation='relu')(conv1)
+        conv3 = Conv2D(64, (3, 3), strides=(1, 1), activation='relu')(conv2)
+        return Flatten()(conv3)
+
+    def _tile_tower(self, image_input):
+        # Ogni tile id diventa un embedding, poi conv 3x3 sulla griglia 16x20 (una cella = un tile)
+        tiles = Reshape(self.image_shape[:2])(image_input)
+        embedded = Embedding(TILE_VOCABULARY, 8)(tiles)
+        conv1 = Conv2D(32, (3, 3), padding='same', activation='relu')(embedded)
+        conv2 = Conv2D(64, (3, 3), strides=(2, 2), padding='same', activation='relu')(conv1)
+        return Flatten()(conv2)
+
+    @tf.function
+    def _blend_target(self, tau):
+        """target = tau * online + (1 - tau) * target, eseguito nel grafo"""
+        for weight, target_weight in zip(self.model.weights, self.target_model.weights):
+            target_weight.assign(tau * weight + (1.0 - tau) * target_weight)
+
     def align_target_model(self):
         """Hard update del target model"""
-        self.target_model.set_weights(self.model.get_weights())
+        self._blend_target(tf.constant(1.0))
 
     def update_target_model(self):
         """Soft update del target model"""
-        weights = self.model.get_weights()
-        target_weights = self.target_model.get_weights()
-        for i in range(len(target_weights)):
-            target_weights[i] = self.tau * weights[i] + (1 - self.tau) * target_weights[i]
-        self.target_model.set_weights(target_weights)
+        self._blend_target(tf.constant(self.tau))
+
+    def use_async_actor(self):
+        """Separa la rete dell'actor da quella allenata dal learner"""
+        self.policy_model = self._build_model()
+        self.policy_model.set_weights(self.model.get_weights())
+        self._policy_fn = None
+
+    def publish_weights(self):
+        """Lato learner: rende disponibili all'actor i pesi correnti"""
+        self._published_weights = self.model.get_weights()
+
+    def sync_actor(self):
+        """Lato actor: adotta gli ultimi pesi pubblicati, se ce ne sono"""
+        weights, self._published_weights = self._published_weights, None
+        if weights is not None:
+            self.policy_model.set_weights(weights)
+
+    @tf.function
+    def _train_step(self, images, players, enemies, actions, rewards, next_images, next_players, next_enemies, dones, weights):
+        """Target di Bellman, loss Huber, update del gradiente e soft update del target in un solo grafo"""
+        future_q = self.target_model({
+            'image_input': next_images,
+            'player_input': next_players,
+            'enemy_input': next_enemies
+        }, training=False)
+        not_done = 1.0 - tf.cast(dones, tf.float32)
+        targets = rewards + self.gamma * tf.reduce_max(future_q, axis=1) * not_done
+
+        with tf.GradientTape() as tape:
+            current_q = self.model({
+                'image_input': images,
+                'player_input': players,
+                'enemy_input': enemies
+            }, training=True)
+            q_taken = tf.gather(current_q, actions, axis=1, batch_dims=1)
+            td_errors = targets - q_taken
+
+            # Huber (delta = 1) pesata con i pesi di importance sampling
+            abs_errors = tf.abs(td_errors)
+            huber = tf.where(abs_errors <= 1.0, 0.5 * tf.square(td_errors), abs_errors - 0.5)
+            loss = tf.reduce_mean(weights * huber)
+
+        gradients = tape.gradient(loss, self.model.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.model.trainable_variables))
+        self._blend_target(self.tau)
+
+        return td_errors
+
+    def remember(self, state, action, reward, next_state, done, stream=0):
+        """Salva l'esperienza nel replay buffer (gli array vengono copiati), stream distingue gli ambienti paralleli"""
+        self.memory.add(state, action, reward, next_state, done, stream=stream)
+
+    def _policy_function(self):
+        """Forward della policy compilato una volta sola, per batch di qualsiasi dimensione"""
+        if self._policy_fn is None:
+            model = self.policy_model
+
+            @tf.function(input_signature=[
+                tf.TensorSpec((None,) + self.image_shape, tf.uint8, name='images'),
+                tf.TensorSpec((None, self.player_state_size), tf.float32, name='players'),
+                tf.TensorSpec((None,) + self.enemy_state_size, tf.float32, name='enemies')
+            ])
+            def policy(images, players, enemies):
+                q_values = model({'image_input': images, 'player_input': players, 'enemy_input': enemies}, training=False)
+                return tf.argmax(q_values, axis=1, output_type=tf.int32)
+
+            self._policy_fn = policy
+
+        return self._policy_fn
+
+    def greedy_actions(self, images, players, enemies) -> np.ndarray:
+        """Azioni greedy per un batch di stati"""
+        if self._tflite is not None:
+            return self._tflite(images, players, enemies)
 
-    def remember(self, state, action, reward, next_state, done):
-        """Salva l'esperienza nel replay buffer"""
-        self.memory.append((state, action, reward, next_state, done))
+        return self._policy_function()(images, players, enemies).numpy()
 
     def act(self, state, training=True):
         """Seleziona un'azione usando epsilon-greedy policy"""
         if training and random.random() < self.epsilon:
             return random.randrange(self.action_size)
         
-        state_dict = {
-            'image_input': np.expand_dims(state['image'], axis=0),
-            'player_input': np.expand_dims(state['player_state'], axis=0),
-            'enemy_input': np.expand_dims(state['enemies_state'], axis=0)
-        }
-        
-        act_values = self.model.predict(state_dict, verbose=0)
-        return np.argmax(act_values[0])
+        start = self.timer.start()
+        images, players, enemies = self._act_inputs
+        images[0] = state['image']
+        players[0] = state['player_state']
+        enemies[0] = state['enemies_state']
+
+        action = int(self.greedy_actions(images, players, enemies)[0])
+        self.timer.lap('act.inference', start)
+        return action
+
+    def act_batch(self, states, training=True) -> np.ndarray:
+        """Seleziona le azioni di più ambienti con un solo forward (states: dict di array (N, ...))"""
+        images = np.asarray(states['image'], dtype=np.uint8)
+        players = np.asarray(states['player_state'], dtype=np.float32)
+        enemies = np.asarray(states['enemies_state'], dtype=np.float32)
+        actions = self.greedy_actions(images, players, enemies)
+
+        if training:
+            explore = np.random.random(len(actions)) < self.epsilon
+            actions[explore] = np.random.randint(0, self.action_size, int(explore.sum()))
+
+        return actions
+
+    def _representative_dataset(self, samples=100):
+        # Campioni di calibrazione presi dal replay buffer, indicizzati per nome dell'input del modello
+        for _ in range(samples):
+            batch = self.memory.sample(1)
+            yield {
+                'image_input': batch['image'],
+                'player_input': batch['player_state'],
+                'enemy_input': batch['enemies_state']
+            }
+
+    def export_tflite(self, path, quantization=None):
+        """Esporta la policy in TFLite; quantization: None, 'float16' o 'int8' (calibrata sul replay buffer)"""
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.policy_model)
+
+        if quantization == 'float16':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == 'int8':
+            if len(self.memory) == 0:
+                raise ValueError("int8 quantization needs samples in the replay buffer for calibration")
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = self._representative_dataset
+        elif quantization is not None:
+            raise ValueError(f"Unknown quantization: {quantization}")
+
+        with open(path, 'wb') as f:
+            f.write(converter.convert())
+
+    def load_tflite(self, path, num_threads=None):
+        """Usa un modello TFLite esportato per act/act_batch"""
+        self._tflite = TFLitePolicy(path, num_threads)
 
     def replay(self, batch_size):
         """Esegue il training su un batch di esperienze"""
@@ -100,72 +268,47 @@ class EnhancedDQNAgent:
             return
         
         # Campiona un batch random dalla memoria
-        minibatch = random.sample(self.memory, batch_size)
-        
-        # Prepara i batch di input
-        state_images = np.zeros((batch_size,) + self.image_shape)
-        state_players = np.zeros((batch_size, self.player_state_size))
-        state_enemies = np.zeros((batch_size,) + self.enemy_state_size)
-        
-        next_state_images = np.zeros((batch_size,) + self.image_shape)
-        next_state_players = np.zeros((batch_size, self.player_state_size))
-        next_state_enemies = np.zeros((batch_size,) + self.enemy_state_size)
-        
-        actions = np.zeros(batch_size, dtype=np.int32)
-        rewards = np.zeros(batch_size)
-        dones = np.zeros(batch_size, dtype=bool)
-        
-        # Popola i batch
-        try:
-            for i, (state, action, reward, next_state, done) in enumerate(minibatch):
-                state_images[i] = state['image']
-                state_players[i] = state['player_state']
-                state_enemies[i] = state['enemies_state']
-                
-                next_state_images[i] = next_state['image']
-                next_state_players[i] = next_state['player_state']
-                next_state_enemies[i] = next_state['enemies_state']
-                
-                actions[i] = action
-                rewards[i] = reward
-                dones[i] = done
+        timer = self.timer
+        start = timer.start()
+        batch = self.memory.sample(batch_size)
+        start = timer.lap('replay.sample', start)
+
+        # numpy() attende la fine dell'update, così il tempo misurato è quello reale
+        td_errors = self._learn(batch)
+        if self.prioritized or timer.enabled:
+            td_errors = td_errors.numpy()
+        start = timer.lap('replay.train', start)
+
+        if self.prioritized:
+            self.memory.update_priorities(batch['indices'], td_errors)
+            timer.lap('replay.priorities', start)
         
-            # Predici i Q-values correnti e futuri
-            current_q = self.model.predict({
-                'image_input': state_images,
-                'player_input': state_players,
-                'enemy_input': state_enemies
-            }, verbose=0)
-            
-            future_q = self.target_model.predict({
-                'image_input': next_state_images,
-                'player_input': next_state_players,
-                'enemy_input': next_state_enemies
-            }, verbose=0)
-            
-            # Aggiorna i target Q-values
-            for i in range(batch_size):
-                if dones[i]:
-                    current_q[i][actions[i]] = rewards[i]
-                else:
-                    current_q[i][actions[i]] = rewards[i] + self.gamma * np.max(future_q[i])
-            
-            # Train del modello
-            self.model.fit({
-                'image_input': state_images,
-                'player_input': state_players,
-                'enemy_input': state_enemies
-            }, current_q, epochs=1, verbose=0)
-            
-            # Aggiorna epsilon
-            if self.epsilon > self.epsilon_min:
-                self.epsilon *= self.epsilon_decay
-            
-            # Soft update del target network
-            self.update_target_model()
-
-        except:
-            print("None data")
+        # Aggiorna epsilon
+        if self.epsilon > self.epsilon_min:
+            self.epsilon *= self.epsilon_decay
+
+    def _learn(self, batch):
+        # Con il replay prioritizzato i pesi di importance sampling correggono il bias del campionamento
+        weights = batch.get('weights')
+        if weights is None:
+            weights = np.ones(len(batch['action']), dtype=np.float32)
+
+        return self._train_step(
+            batch['image'], batch['player_state'], batch['enemies_state'],
+            batch['action'], batch['reward'],
+            batch['next_image'], batch['next_player_state'], batch['next_enemies_state'],
+            batch['done'], weights
+        )
+
+    def pretrain(self, source, batch_size, updates, target_interval=1000):
+        """
+        Training offline da un TransitionDataset (o DatasetSampler) senza ambiente: epsilon e priorità non cambiano.
+        Il target viene riallineato ogni target_interval update, oltre al soft update di ogni passo.
+        """
+        for update in range(1, updates + 1):
+            self._learn(source.sample(batch_size))
+            if update % target_interval == 0:
+                self.update_target_model()
 
     def load(self, name):
         """Carica i pesi del modello"""
@@ -174,4 +317,37 @@ class EnhancedDQNAgent:
 
     def save(self, name):
         """Salva i pesi del modello"""
-        self.model.save_weights(name)
\ No newline at end of file
+        self.model.save_weights(name)
+
+
+class TFLitePolicy:
+    """Interprete TFLite della policy, con input ridimensionati solo quando cambia la dimensione del batch"""
+    def __init__(self, path, num_threads=None):
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=num_threads)
+        self.batch_size = None
+
+        # Il convertitore ordina gli input per nome: li rimette come (image, player, enemy)
+        details = {detail['name']: detail for detail in self.interpreter.get_input_details()}
+        inputs = [
+            next(detail for name, detail in details.items() if key in name)
+            for key in ('image_input', 'player_input', 'enemy_input')
+        ]
+        self.input_indices = tuple(detail['index'] for detail in inputs)
+        self.input_dtypes = tuple(detail['dtype'] for detail in inputs)
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+
+    def __call__(self, images, players, enemies) -> np.ndarray:
+        inputs = (images, players, enemies)
+        batch_size = len(images)
+
+        if batch_size != self.batch_size:
+            for index, value in zip(self.input_indices, inputs):
+                self.interpreter.resize_tensor_input(index, np.shape(value))
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch_size
+
+        for index, dtype, value in zip(self.input_indices, self.input_dtypes, inputs):
+            self.interpreter.set_tensor(index, np.ascontiguousarray(value, dtype=dtype))
+        self.interpreter.invoke()
+
+        return self.interpreter.get_tensor(self.output_index).argmax(axis=1).astype(np.int32)
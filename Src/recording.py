@@ -0,0 +1,378 @@
+# 17.10.26
+
+import io
+import json
+import struct
+import zlib
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# External libraries
+import numpy as np
+
+
+# Internal utilities
+from .Engine.offset import Offset
+from .rewards import RewardPipeline
+
+
+# Variable
+MAGIC = b'SMLREC01'
+TRAILER_MAGIC = b'SMLIDX01'
+VERSION = 2                 # 2: il blocco dello stato iniziale contiene anche la prima osservazione
+
+# Blocchi del log: (tipo, episodio, primo step, numero di step, lunghezza del payload)
+BLOCK_HEADER = struct.Struct('<BIIII')
+TRAILER = struct.Struct('<Q8s')
+STATE_BLOCK = 1
+STEPS_BLOCK = 2
+FRAMES_BLOCK = 3
+
+# Byte di RAM salvati ad ogni step: bastano per verificare il replay e per il debug
+RECORDED_RAM = (
+    Offset.MARIO_X_POS, Offset.MARIO_Y_POS, Offset.MARIO_POSE, Offset.JUMP_STATE,
+    Offset.LEVEL_PROGRESS, Offset.LEVEL_SCROLL_X, Offset.GAME_OVER, Offset.POWERUP_STATUS,
+    Offset.POWERUP_STATUS_TIMER, Offset.LIVES, Offset.CURRENT_WORLD, Offset.CURRENT_STAGE,
+) + tuple(range(Offset.SCORE, Offset.SCORE + 6))
+
+# Contatori di MarioEnvironment da cui dipendono i reward: vengono salvati con lo stato iniziale
+ENVIRONMENT_COUNTERS = ('current_steps', 'stuck_counter', 'last_position', 'last_score',
+                        'inactivity_episodes', 'consecutive_stuck_episodes', 'long_jump_mode')
+
+
+def step_dtype(ram_size: int) -> np.dtype:
+    return np.dtype([
+        ('action', np.uint8),
+        ('long_jump', np.bool_),
+        ('done', np.bool_),
+        ('skipped', np.uint16),
+        ('reward', np.float32),
+        ('ram', np.uint8, (ram_size,)),
+    ])
+
+
+class EpisodeRecorder:
+    """
+    Registra episodi di MarioEnvironment in un file binario append-only:
+    header JSON, per ogni episodio un save-state iniziale e blocchi zlib di chunk_steps step
+    (azione, reward, byte di RAM, opzionalmente il frame più recente), indice JSON in coda al file.
+    Con l'emulazione deterministica azioni e stato iniziale bastano per rigiocare l'episodio (EpisodePlayer).
+    """
+    def __init__(self, path: str, ram_addresses=RECORDED_RAM, record_frames: bool = False,
+                 chunk_steps: int = 256, level: int = 6):
+        self.path = path
+        self.ram_addresses = [int(address) for address in ram_addresses]
+        self.record_frames = record_frames
+        self.chunk_steps = chunk_steps
+        self.level = level
+        self.dtype = step_dtype(len(self.ram_addresses))
+
+        self.file = None
+        self.index = []             # Un dizionario per episodio, scritto come footer da close()
+        self.episode = -1
+        self.steps = 0
+        self._chunk = np.zeros(chunk_steps, dtype=self.dtype)
+        self._frames = []
+        self._chunk_start = 0
+        self._count = 0
+        self._long_jump = False     # long_jump_mode prima dello step, quello usato da step() per scegliere la macro
+
+    def _open(self, env):
+        self.file = open(self.path, 'wb')
+        header = json.dumps({
+            'version': VERSION,
+            'rom': env.rom_path,
+            'observation': env.observation,
+            'frame_skip': env.frame_skip,
+            'reward_config': env.rewards.config,
+            'ram_addresses': self.ram_addresses,
+            'frame_shape': list(env.observation_specs['image'][0][:2]) if self.record_frames else None,
+        }).encode()
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+
+    def _write_block(self, kind: int, first: int, count: int, payload: bytes) -> int:
+        offset = self.file.tell()
+        self.file.write(BLOCK_HEADER.pack(kind, self.episode, first, count, len(payload)))
+        self.file.write(payload)
+        return offset
+
+    def begin(self, env, state: Dict = None):
+        """
+        Inizia un episodio: da chiamare subito dopo env.reset(), con l'osservazione restituita.
+        L'osservazione iniziale viene salvata perché la griglia di tile dipende da registri che il save-state
+        non ripristina: senza state il player ricalcola la prima osservazione dopo il load.
+        """
+        if self.file is None:
+            self._open(env)
+        self.end()
+
+        # Nessun tasto premuto nello stato salvato, come dopo il load del player
+        env.macros.release_all()
+        buffer = io.BytesIO()
+        env.pyboy.save_state(buffer)
+
+        image = b'' if state is None else zlib.compress(np.ascontiguousarray(state['image']).tobytes(), self.level)
+        meta = json.dumps({
+            'counters': {name: getattr(env, name) for name in ENVIRONMENT_COUNTERS},
+            'image': None if state is None else list(state['image'].shape),
+        }).encode()
+        payload = (struct.pack('<I', len(meta)) + meta + struct.pack('<I', len(image)) + image
+                   + zlib.compress(buffer.getvalue(), self.level))
+
+        self.episode += 1
+        self.steps = 0
+        self._chunk_start = 0
+        self._count = 0
+        self._long_jump = env.long_jump_mode
+        self.index.append({'state': self._write_block(STATE_BLOCK, 0, 0, payload), 'steps': 0,
+                           'chunks': [], 'frames': []})
+
+    def record(self, env, action: int, reward: float, done: bool, info: Dict, state: Dict = None):
+        """Aggiunge uno step; state (l'osservazione restituita da step) serve solo con record_frames"""
+        row = self._chunk[self._count]
+        row['action'] = action
+        row['long_jump'] = self._long_jump
+        row['done'] = done
+        row['skipped'] = min(info.get('skipped_frames', 0), 0xFFFF)
+        row['reward'] = reward
+        row['ram'] = [env.pyboy.memory[address] for address in self.ram_addresses]
+        self._long_jump = env.long_jump_mode
+
+        if self.record_frames:
+            self._frames.append(np.array(state['image'][..., -1], dtype=np.uint8))
+
+        self._count += 1
+        self.steps += 1
+        if self._count == self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        """Scrive il chunk corrente come blocco compresso"""
+        if self._count == 0:
+            return
+
+        entry = self.index[self.episode]
+        payload = zlib.compress(self._chunk[:self._count].tobytes(), self.level)
+        entry['chunks'].append((self._write_block(STEPS_BLOCK, self._chunk_start, self._count, payload),
+                                self._chunk_start, self._count))
+
+        if self._frames:
+            payload = zlib.compress(np.stack(self._frames).tobytes(), self.level)
+            entry['frames'].append((self._write_block(FRAMES_BLOCK, self._chunk_start, self._count, payload),
+                                    self._chunk_start, self._count))
+            self._frames = []
+
+        entry['steps'] = self.steps
+        self._chunk_start = self.steps
+        self._count = 0
+
+    def end(self):
+        """Chiude l'episodio corrente (chiamato anche da begin e close)"""
+        if self.episode >= 0:
+            self.flush()
+            self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+
+        self.end()
+        footer_offset = self.file.tell()
+        footer = json.dumps({'episodes': self.index}).encode()
+        self.file.write(footer)
+        self.file.write(TRAILER.pack(footer_offset, TRAILER_MAGIC))
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EpisodeReader:
+    """
+    Lettura di un file di EpisodeRecorder con accesso casuale tramite l'indice in coda al file.
+    Se il file non è stato chiuso (es. crash del training) l'indice viene ricostruito leggendo i blocchi.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not an episode recording: {path}")
+        length, = struct.unpack('<I', self.file.read(4))
+        self.header = json.loads(self.file.read(length))
+        if self.header.get('version') != VERSION:
+            self.file.close()
+            raise ValueError(f"Recording version {self.header.get('version')} is not supported "
+                             f"(expected {VERSION}): {path}")
+        self.ram_addresses = self.header['ram_addresses']
+        self.dtype = step_dtype(len(self.ram_addresses))
+        self._data_start = self.file.tell()
+
+        self.episodes = self._read_footer()
+        if self.episodes is None:
+            self.episodes = self._scan()
+
+    def _read_footer(self) -> Optional[List[Dict]]:
+        self.file.seek(0, io.SEEK_END)
+        size = self.file.tell()
+        if size - self._data_start < TRAILER.size:
+            return None
+
+        self.file.seek(size - TRAILER.size)
+        footer_offset, magic = TRAILER.unpack(self.file.read(TRAILER.size))
+        if magic != TRAILER_MAGIC:
+            return None
+
+        self.file.seek(footer_offset)
+        return json.loads(self.file.read(size - TRAILER.size - footer_offset))['episodes']
+
+    def _scan(self) -> List[Dict]:
+        """Ricostruisce l'indice dai blocchi completi; un blocco troncato chiude la scansione"""
+        episodes = []
+        offset = self._data_start
+        self.file.seek(0, io.SEEK_END)
+        size = self.file.tell()
+
+        while offset + BLOCK_HEADER.size <= size:
+            self.file.seek(offset)
+            kind, episode, first, count, length = BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
+            if offset + BLOCK_HEADER.size + length > size:
+                break
+
+            if kind == STATE_BLOCK:
+                episodes.append({'state': offset, 'steps': 0, 'chunks': [], 'frames': []})
+            elif kind == STEPS_BLOCK:
+                episodes[episode]['chunks'].append((offset, first, count))
+                episodes[episode]['steps'] = first + count
+            elif kind == FRAMES_BLOCK:
+                episodes[episode]['frames'].append((offset, first, count))
+
+            offset += BLOCK_HEADER.size + length
+
+        return episodes
+
+    def __len__(self) -> int:
+        return len(self.episodes)
+
+    def _block(self, offset: int) -> bytes:
+        self.file.seek(offset)
+        *_, length = BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
+        return self.file.read(length)
+
+    def initial_state(self, episode: int) -> Tuple[io.BytesIO, Dict, Optional[np.ndarray]]:
+        """Save-state iniziale, contatori dell'ambiente e osservazione image all'inizio dell'episodio (se salvata)"""
+        payload = self._block(self.episodes[episode]['state'])
+        length, = struct.unpack_from('<I', payload)
+        meta = json.loads(payload[4:4 + length])
+        offset = 4 + length
+        length, = struct.unpack_from('<I', payload, offset)
+        offset += 4
+
+        image = None
+        if meta['image'] is not None:
+            image = np.frombuffer(zlib.decompress(payload[offset:offset + length]), dtype=np.uint8)
+            image = image.reshape(meta['image'])
+        return io.BytesIO(zlib.decompress(payload[offset + length:])), meta['counters'], image
+
+    def _chunk(self, offset: int) -> np.ndarray:
+        return np.frombuffer(zlib.decompress(self._block(offset)), dtype=self.dtype)
+
+    def steps(self, episode: int) -> np.ndarray:
+        """Tutti gli step dell'episodio come array strutturato"""
+        chunks = [self._chunk(offset) for offset, _, _ in self.episodes[episode]['chunks']]
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=self.dtype)
+
+    def step(self, episode: int, index: int) -> np.void:
+        """Un solo step, decomprimendo solo il chunk che lo contiene"""
+        chunks = self.episodes[episode]['chunks']
+        position = bisect_right([first for _, first, _ in chunks], index) - 1
+        if index < 0 or position < 0 or index >= chunks[position][1] + chunks[position][2]:
+            raise IndexError(f"Step {index} not in episode {episode}")
+
+        offset, first, _ = chunks[position]
+        return self._chunk(offset)[index - first]
+
+    def frames(self, episode: int) -> np.ndarray:
+        """Frame registrati (steps, H, W) uint8; vuoto se il file non ha frame"""
+        shape = self.header['frame_shape']
+        if not shape:
+            return np.zeros((0, 0, 0), dtype=np.uint8)
+
+        frames = [np.frombuffer(zlib.decompress(self._block(offset)), dtype=np.uint8).reshape((count, *shape))
+                  for offset, _, count in self.episodes[episode]['frames']]
+        return np.concatenate(frames) if frames else np.zeros((0, *shape), dtype=np.uint8)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EpisodePlayer:
+    """
+    Rigioca un episodio registrato: carica il save-state iniziale e ripete le azioni in un MarioEnvironment
+    con la stessa configurazione. Con verify ogni step viene confrontato con i byte di RAM e il reward registrati.
+    """
+    def __init__(self, reader: EpisodeReader, env):
+        self.reader = reader
+        self.env = env
+        self.ram_addresses = reader.ram_addresses
+
+        # I reward registrati dipendono dai termini usati durante la registrazione
+        if reader.header.get('reward_config') is not None:
+            env.rewards = RewardPipeline(reader.header['reward_config'])
+
+    def load(self, episode: int) -> Dict:
+        """Porta l'ambiente all'inizio dell'episodio e restituisce la prima osservazione"""
+        save_state, counters, image = self.reader.initial_state(episode)
+        env = self.env
+        env.pyboy.load_state(save_state)
+        env.monitor.invalidate()
+        env.macros.reset()
+
+        for name, value in counters.items():
+            setattr(env, name, value)
+
+        # Il save-state contiene anche lo schermo: lo stack riparte dal frame salvato, come nel reset
+        if env.observation == 'pixels':
+            env.preprocess_frame(reset=True)
+
+        state = env.get_state(env.monitor.snapshot())
+        if image is not None:
+            state['image'] = image
+        return state
+
+    def play(self, episode: int, verify: bool = True) -> Iterator[Tuple[Dict, float, bool, Dict]]:
+        """Genera (state, reward, done, info) per ogni step registrato"""
+        self.load(episode)
+        yield from self._replay(episode, verify)
+
+    def transitions(self, episode: int, verify: bool = True) -> Iterator[Tuple[Dict, int, float, Dict, bool]]:
+        """Genera (state, action, reward, next_state, done), come agent.remember; gli stati sono viste da copiare"""
+        state = self.load(episode)
+        actions = self.reader.steps(episode)['action']
+
+        for action, (next_state, reward, done, _) in zip(actions, self._replay(episode, verify)):
+            yield state, int(action), reward, next_state, done
+            state = next_state
+
+    def _replay(self, episode: int, verify: bool) -> Iterator[Tuple[Dict, float, bool, Dict]]:
+        for index, step in enumerate(self.reader.steps(episode)):
+            self.env.long_jump_mode = bool(step['long_jump'])
+            state, reward, done, info = self.env.step(int(step['action']))
+
+            if verify:
+                ram = np.array([self.env.pyboy.memory[address] for address in self.ram_addresses], dtype=np.uint8)
+                if not np.array_equal(ram, step['ram']) or np.float32(reward) != step['reward']:
+                    raise RuntimeError(f"Replay of episode {episode} diverged at step {index}")
+
+            yield state, reward, done, info
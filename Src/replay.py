@@ -0,0 +1,248 @@
+# 17.10.26
+
+import threading
+from typing import Dict, Tuple
+
+
+# External libraries
+import numpy as np
+
+
+# Internal utilities
+from .frames import gather_stacks
+
+
+class ReplayBuffer:
+    """
+    Replay memory in array contigui preallocati. Ogni slot contiene un solo frame (l'ultimo dello stack) e le feature
+    di uno stato: lo stack di k frame viene ricostruito al campionamento risalendo i puntatori prev, fino al primo
+    frame dell'episodio. Le transizioni consecutive di uno stesso ambiente (stream) condividono lo slot dello stato:
+    il next_state di una transizione è lo state della successiva.
+    """
+    def __init__(self, capacity: int, image_shape: Tuple, player_state_size: int, enemy_state_size: Tuple):
+        if capacity < 2:
+            raise ValueError("The replay buffer needs at least 2 slots")
+        self.capacity = capacity
+        self.frame_stack = image_shape[-1]
+        self.images = np.zeros((capacity,) + tuple(image_shape[:-1]), dtype=np.uint8)
+        self.players = np.zeros((capacity, player_state_size), dtype=np.float32)
+        self.enemies = np.zeros((capacity,) + tuple(enemy_state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+
+        # prev[i]: slot del frame precedente dello stesso episodio (-1 al primo frame);
+        # stamp[i]: numero progressivo di scrittura, il collegamento vale finché stamp[prev[i]] == prev_stamp[i]
+        self.prev = np.full(capacity, -1, dtype=np.int64)
+        self.stamp = np.zeros(capacity, dtype=np.int64)
+        self.prev_stamp = np.zeros(capacity, dtype=np.int64)
+        self._writes = 0
+
+        # valid[i]: lo slot i è lo stato di una transizione completa, il cui next è nello slot next[i] (-1 se assente)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.next = np.full(capacity, -1, dtype=np.int64)
+        self.size = 0
+        self.filled = 0
+        self.cursor = -1            # Ultimo slot scritto
+        self._last_index = -1       # Slot dello stato dell'ultima transizione aggiunta
+        self._streams = {}          # stream -> (ultimo next_state, suo slot, suo stamp)
+        self.rng = np.random.default_rng()
+
+        # add e sample possono arrivare da thread diversi (actor e learner)
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _write_state(self, state: Dict, prev: int) -> int:
+        index = self.cursor = (self.cursor + 1) % self.capacity
+
+        # Se lo slot era il next di una transizione ancora valida, anche quella va scartata
+        previous = self.prev[index]
+        if previous >= 0 and self.valid[previous] and self.next[previous] == index:
+            self._invalidate(previous)
+
+        # La transizione dello slot e le k - 1 successive dello stesso episodio hanno il frame nei loro stack
+        current = index
+        for _ in range(self.frame_stack):
+            self._invalidate(current)
+            following = self.next[current]
+            if (following < 0 or self.prev[following] != current
+                    or self.prev_stamp[following] != self.stamp[current]):
+                break
+            current = following
+        self.next[index] = -1
+
+        self.images[index] = state['image'][..., -1]
+        self.players[index] = state['player_state']
+        self.enemies[index] = state['enemies_state']
+        self.prev_stamp[index] = self.stamp[prev] if prev >= 0 else 0
+        self.prev[index] = prev
+        self._writes += 1
+        self.stamp[index] = self._writes
+        self.filled = max(self.filled, index + 1)
+        return index
+
+    def _invalidate(self, index: int):
+        if self.valid[index]:
+            self.valid[index] = False
+            self.size -= 1
+
+    def add(self, state: Dict, action: int, reward: float, next_state: Dict, done: bool, stream: int = 0):
+        """stream distingue gli ambienti che aggiungono transizioni alternate allo stesso buffer"""
+        with self.lock:
+            self._add(state, action, reward, next_state, done, stream)
+
+    def _add(self, state: Dict, action: int, reward: float, next_state: Dict, done: bool, stream: int = 0):
+        last = self._streams.get(stream)
+        chained = last is not None and state is last[0] and self.stamp[last[1]] == last[2]
+        if chained and last[1] != (self.cursor + 1) % self.capacity:
+            # Lo stato è il next della transizione precedente dello stream, già salvato e non sovrascritto
+            index = last[1]
+        else:
+            # Nuovo episodio, oppure lo slot dello stato sta per essere sovrascritto: lo stato viene riscritto
+            # mantenendo il collegamento al frame precedente
+            index = self._write_state(state, self.prev[last[1]] if chained else -1)
+
+        next_index = self._write_state(next_state, index)
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.dones[index] = done
+        self.next[index] = next_index
+
+        self.valid[index] = True
+        self.size += 1
+        self._last_index = index
+        self._streams[stream] = (next_state, next_index, self.stamp[next_index])
+
+    def _linked(self, current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+        return self.stamp[previous] == self.prev_stamp[current]
+
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        """Indici uniformi tra le transizioni valide (rejection sampling vettoriale)"""
+        indices = np.empty(0, dtype=np.int64)
+        while len(indices) < batch_size:
+            candidates = self.rng.integers(0, self.filled, size=2 * batch_size)
+            indices = np.concatenate([indices, candidates[self.valid[candidates]]])
+
+        return indices[:batch_size]
+
+    def gather(self, indices: np.ndarray) -> Dict[str, np.ndarray]:
+        next_indices = self.next[indices]
+        return {
+            'image': gather_stacks(self.images, self.prev, indices, self.frame_stack, self._linked),
+            'player_state': self.players[indices],
+            'enemies_state': self.enemies[indices],
+            'action': self.actions[indices].astype(np.int32),
+            'reward': self.rewards[indices],
+            'next_image': gather_stacks(self.images, self.prev, next_indices, self.frame_stack, self._linked),
+            'next_player_state': self.players[next_indices],
+            'next_enemies_state': self.enemies[next_indices],
+            'done': self.dones[indices],
+        }
+
+    def sample(self, batch_size: int) -> Dict[str, np.ndarray]:
+        with self.lock:
+            return self.gather(self.sample_indices(batch_size))
+
+
+class SumTree:
+    """Sum tree su array: aggiornamento delle priorità e campionamento per somma prefissa in O(log n)"""
+    def __init__(self, capacity: int):
+        self.leaves = 1 << max(capacity - 1, 1).bit_length()
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        return self.tree[1]
+
+    def get(self, indices: np.ndarray) -> np.ndarray:
+        return self.tree[indices + self.leaves]
+
+    def update(self, indices: np.ndarray, priorities: np.ndarray):
+        nodes = np.asarray(indices, dtype=np.int64) + self.leaves
+        self.tree[nodes] = priorities
+
+        # Ricalcola i soli antenati dei nodi modificati, un livello alla volta
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """Indice della foglia in cui cade ogni valore della somma prefissa"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Prioritized experience replay (variante proporzionale) sopra ReplayBuffer.
+    Le transizioni vengono estratte con probabilità p^alpha / sum(p^alpha)
+    e restituite con i pesi di importance sampling.
+    """
+    def __init__(self, capacity: int, image_shape: Tuple, player_state_size: int, enemy_state_size: Tuple,
+                 alpha: float = 0.6, beta: float = 0.4, beta_steps: int = 100000, epsilon: float = 1e-6):
+        self.tree = SumTree(capacity)
+        super().__init__(capacity, image_shape, player_state_size, enemy_state_size)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = (1.0 - beta) / beta_steps
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+
+    def _invalidate(self, index: int):
+        if self.valid[index]:
+            self.tree.update(np.array([index]), np.zeros(1))
+        super()._invalidate(index)
+
+    def _add(self, state: Dict, action: int, reward: float, next_state: Dict, done: bool, stream: int = 0):
+        super()._add(state, action, reward, next_state, done, stream)
+
+        # Le nuove transizioni entrano con la priorità massima vista finora
+        index = self._last_index
+        self.tree.update(np.array([index]), np.array([self.max_priority ** self.alpha]))
+
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        # Campionamento stratificato: un valore per ogni segmento della somma totale
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        indices = self.tree.find(values)
+
+        # Errori di arrotondamento possono finire su una foglia vuota
+        invalid = ~self.valid[indices]
+        if invalid.any():
+            indices[invalid] = super().sample_indices(int(invalid.sum()))
+
+        return indices
+
+    def sample(self, batch_size: int) -> Dict[str, np.ndarray]:
+        with self.lock:
+            indices = self.sample_indices(batch_size)
+            batch = self.gather(indices)
+            probabilities = self.tree.get(indices) / self.tree.total
+            size = self.size
+
+        weights = (size * probabilities) ** -self.beta
+        batch['indices'] = indices
+        batch['weights'] = (weights / weights.max()).astype(np.float32)
+
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return batch
+
+    def update_priorities(self, indices: np.ndarray, td_errors: np.ndarray):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+        # Un indice potrebbe essere stato sovrascritto dopo il campionamento
+        with self.lock:
+            keep = self.valid[indices]
+            self.tree.update(indices[keep], priorities[keep] ** self.alpha)
@@ -0,0 +1,196 @@
+# 17.10.26
+
+from typing import Dict, Tuple
+
+
+# External libraries
+import numpy as np
+
+
+# Variable
+# Configurazione di default: riproduce i reward storici di MarioEnvironment.step.
+# Ogni voce è un termine attivo: un numero è il solo peso, un dizionario contiene 'weight' e i parametri del termine
+DEFAULT_REWARD_CONFIG = {
+    'progress': {'weight': 1.0, 'forward': 0.1, 'backward': 1.0},
+    'score': {'weight': 0.5},
+    'jump': {'weight': 1.0, 'success': 2.0, 'success_y': 100, 'unnecessary': -1.0, 'enemy_distance': 40},
+    'danger': {'weight': 1.0, 'bands': (30, 45), 'penalties': (-5.0, -2.0)},
+    'inactivity': {'weight': 1.0, 'penalty': -500.0},
+    'death': {'weight': 1.0, 'penalty': -100.0, 'override': True},
+}
+
+REWARD_TERMS = {}
+
+
+def register_term(name: str):
+    """Registra una classe RewardTerm con il nome usato nella configurazione"""
+    def decorator(cls):
+        REWARD_TERMS[name] = cls
+        return cls
+    return decorator
+
+
+class RewardContext:
+    """Valori di uno step da cui si calcolano i termini; gli array sono viste sullo snapshot corrente"""
+    __slots__ = ('x_progress', 'score_delta', 'mario_y', 'jumped', 'long_jump_mode', 'stuck', 'alive',
+                 'distances', 'collisions', 'threat_distance')
+
+    def __init__(self):
+        self.x_progress = 0
+        self.score_delta = 0
+        self.mario_y = 0
+        self.jumped = False             # L'azione era un salto
+        self.long_jump_mode = False
+        self.stuck = False              # Mario è fermo da troppi step
+        self.alive = True
+        self.distances = np.zeros(0, dtype=np.float32)      # Distanza da Mario di ogni entità attiva
+        self.collisions = np.zeros(0, dtype=np.float32)     # 1 se la hitbox dell'entità tocca quella di Mario
+        self.threat_distance = np.inf                       # Distanza tra le hitbox dal pericolo più vicino davanti
+
+
+class RewardTerm:
+    def __call__(self, context: RewardContext) -> float:
+        raise NotImplementedError
+
+    def overrides(self, context: RewardContext) -> bool:
+        """True se in questo step il termine sostituisce la somma di tutti gli altri"""
+        return False
+
+
+@register_term('progress')
+class ProgressTerm(RewardTerm):
+    """Avanzamento orizzontale: forward per pixel verso destra, -backward per pixel indietro"""
+    def __init__(self, forward: float = 0.1, backward: float = 1.0):
+        self.forward = forward
+        self.backward = backward
+
+    def __call__(self, context):
+        progress = context.x_progress
+        return progress * self.forward if progress > 0 else -abs(progress) * self.backward
+
+
+@register_term('score')
+class ScoreTerm(RewardTerm):
+    """Punti guadagnati nello step"""
+    def __call__(self, context):
+        return float(max(context.score_delta, 0))
+
+
+@register_term('jump')
+class JumpTerm(RewardTerm):
+    """Bonus per i salti che portano Mario in alto, penalità per i salti senza entità vicine (fuori da long jump)"""
+    def __init__(self, success: float = 2.0, success_y: int = 100, unnecessary: float = -1.0, enemy_distance: float = 40):
+        self.success = success
+        self.success_y = success_y
+        self.unnecessary = unnecessary
+        self.enemy_distance = enemy_distance
+
+    def __call__(self, context):
+        if not context.jumped:
+            return 0.0
+
+        reward = self.success if context.mario_y < self.success_y else 0.0
+        if not context.long_jump_mode and not (context.distances < self.enemy_distance).any():
+            reward += self.unnecessary
+        return reward
+
+
+@register_term('danger')
+class DangerTerm(RewardTerm):
+    """Penalità per ogni entità in base alla fascia di distanza: penalties[i] sotto bands[i], nulla oltre l'ultima"""
+    def __init__(self, bands=(30, 45), penalties=(-5.0, -2.0)):
+        if len(bands) != len(penalties):
+            raise ValueError("bands and penalties must have the same length")
+        self.bands = np.asarray(bands, dtype=np.float32)
+        self.penalties = np.append(np.asarray(penalties, dtype=np.float64), 0.0)
+
+    def __call__(self, context):
+        if len(context.distances) == 0:
+            return 0.0
+        return float(self.penalties[np.searchsorted(self.bands, context.distances, side='right')].sum())
+
+
+@register_term('collision')
+class CollisionTerm(RewardTerm):
+    """Penalità per ogni entità che collide con Mario (non attivo nella configurazione di default)"""
+    def __init__(self, penalty: float = -100.0):
+        self.penalty = penalty
+
+    def __call__(self, context):
+        return float(np.count_nonzero(context.collisions)) * self.penalty
+
+
+@register_term('threat')
+class ThreatTerm(RewardTerm):
+    """Penalità crescente quando il pericolo più vicino nella direzione di Mario è entro distance pixel (non di default)"""
+    def __init__(self, penalty: float = -2.0, distance: float = 24):
+        self.penalty = penalty
+        self.distance = distance
+
+    def __call__(self, context):
+        if context.threat_distance >= self.distance:
+            return 0.0
+        return self.penalty * (1.0 - context.threat_distance / self.distance)
+
+
+@register_term('inactivity')
+class InactivityTerm(RewardTerm):
+    """Penalità ad ogni step in cui Mario risulta bloccato"""
+    def __init__(self, penalty: float = -500.0):
+        self.penalty = penalty
+
+    def __call__(self, context):
+        return self.penalty if context.stuck else 0.0
+
+
+@register_term('death')
+class DeathTerm(RewardTerm):
+    """Penalità alla morte; con override è l'unico reward dello step"""
+    def __init__(self, penalty: float = -100.0, override: bool = True):
+        self.penalty = penalty
+        self.override = override
+
+    def __call__(self, context):
+        return 0.0 if context.alive else self.penalty
+
+    def overrides(self, context):
+        return self.override and not context.alive
+
+
+class RewardPipeline:
+    """
+    Reward come somma pesata di termini configurabili (vedi DEFAULT_REWARD_CONFIG e REWARD_TERMS).
+    Restituisce anche il valore pesato di ogni termine, per la diagnostica.
+    """
+    def __init__(self, config: Dict = None):
+        config = DEFAULT_REWARD_CONFIG if config is None else config
+        self.config = config            # Configurazione risolta, salvata nelle registrazioni
+        self.terms = []
+
+        for name, options in config.items():
+            if name not in REWARD_TERMS:
+                raise ValueError(f"Unknown reward term: {name} (available: {', '.join(REWARD_TERMS)})")
+
+            options = {'weight': options} if isinstance(options, (int, float)) else dict(options)
+            weight = float(options.pop('weight', 1.0))
+            if weight != 0.0:
+                self.terms.append((name, weight, REWARD_TERMS[name](**options)))
+
+    @property
+    def names(self):
+        return [name for name, _, _ in self.terms]
+
+    def __call__(self, context: RewardContext) -> Tuple[float, Dict[str, float]]:
+        values = {}
+        total = 0.0
+        override = None
+
+        for name, weight, term in self.terms:
+            value = weight * term(context)
+            values[name] = value
+            total += value
+
+            if term.overrides(context):
+                override = value if override is None else override + value
+
+        return (total if override is None else override), values
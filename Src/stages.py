@@ -0,0 +1,74 @@
+# 17.10.26
+
+import io
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+
+# External libraries
+import numpy as np
+
+
+# Variable
+WORLDS = 4
+STAGES_PER_WORLD = 3
+ALL_STAGES = [(world, stage) for world in range(1, WORLDS + 1) for stage in range(1, STAGES_PER_WORLD + 1)]
+
+
+def stage_name(world: int, stage: int) -> str:
+    return f"{world}-{stage}"
+
+
+class StageLibrary:
+    """
+    Save-state all'inizio di ogni stage ("1-1" ... "4-3"), compressi con zlib.
+    Si salva su un unico file .npz; sample() sceglie uno stage in base ai pesi.
+    """
+    def __init__(self, states: Dict[str, bytes], seed=None):
+        self.states = states
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.states)
+
+    def add(self, name: str, save_state: bytes):
+        self.states[name] = zlib.compress(save_state, 1)
+
+    def save(self, path: str):
+        np.savez(path, **{name: np.frombuffer(state, dtype=np.uint8) for name, state in self.states.items()})
+
+    @classmethod
+    def load(cls, path: str, seed=None) -> 'StageLibrary':
+        with np.load(path) as data:
+            return cls({name: data[name].tobytes() for name in data.files}, seed)
+
+    def probabilities(self, weights: Optional[Dict[str, float]] = None) -> Tuple[List[str], np.ndarray]:
+        """Stage con peso > 0 e relative probabilità; senza pesi la scelta è uniforme"""
+        names = self.names
+        if weights is None:
+            p = np.ones(len(names))
+        else:
+            unknown = set(weights) - set(names)
+            if unknown:
+                raise KeyError(f"Stages not in the library: {sorted(unknown)}")
+            p = np.array([weights.get(name, 0.0) for name in names], dtype=np.float64)
+
+        keep = p > 0
+        if not keep.any():
+            raise ValueError("No stage with a positive weight")
+        names = [name for name, k in zip(names, keep) if k]
+        return names, p[keep] / p[keep].sum()
+
+    def state(self, name: str) -> io.BytesIO:
+        """Save-state decompresso, pronto per pyboy.load_state"""
+        return io.BytesIO(zlib.decompress(self.states[name]))
+
+    def sample(self, weights: Optional[Dict[str, float]] = None) -> Tuple[str, io.BytesIO]:
+        names, p = self.probabilities(weights)
+        name = names[self.rng.choice(len(names), p=p)]
+        return name, self.state(name)
+
@@ -0,0 +1,162 @@
+# 17.10.26
+
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from typing import Dict
+
+
+# External libraries
+import numpy as np
+
+
+# Variable
+MAX_STAGES = 32
+WINDOW = 1024               # Durate recenti per stage da cui si calcolano i percentili
+
+# Limiti superiori dei bucket in secondi (Prometheus), l'ultimo bucket è +Inf
+BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+_BUCKETS_NS = [int(bound * 1e9) for bound in BUCKETS]
+
+
+class NullTimer:
+    """Timer disattivato: stessi metodi di StageTimer, nessuna lettura del clock"""
+    enabled = False
+
+    def start(self) -> int:
+        return 0
+
+    def lap(self, stage: str, start: int) -> int:
+        return 0
+
+    def latest(self, prefix: str = '') -> Dict[str, float]:
+        return {}
+
+    def maybe_dump(self):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class StageTimer:
+    """
+    Durate per stage (es. 'step.emulation') da perf_counter_ns, in array preallocati:
+    ultime WINDOW durate in un ring per i percentili recenti, istogramma cumulativo a bucket fissi, somma e conteggio.
+    Uso: start = timer.start(); ...; start = timer.lap('step.decode', start); ...
+    Se path è impostato, maybe_dump() scrive le metriche ogni dump_interval secondi (Prometheus se .prom, altrimenti JSON).
+    """
+    enabled = True
+
+    def __init__(self, window: int = WINDOW, path: str = None, dump_interval: float = 30.0):
+        self.window = window
+        self.path = path
+        self.dump_interval = dump_interval
+
+        self.stages: Dict[str, int] = {}
+        self._lock = threading.Lock()       # Il learner asincrono registra i suoi stage da un altro thread
+        self.recent = np.zeros((MAX_STAGES, window), dtype=np.int64)
+        self.buckets = np.zeros((MAX_STAGES, len(BUCKETS) + 1), dtype=np.int64)
+        self.total_ns = np.zeros(MAX_STAGES, dtype=np.int64)
+        self.count = np.zeros(MAX_STAGES, dtype=np.int64)
+        self.last_ns = np.zeros(MAX_STAGES, dtype=np.int64)
+        self._next_dump = time.monotonic() + dump_interval
+
+    def _index(self, stage: str) -> int:
+        index = self.stages.get(stage)
+        if index is None:
+            with self._lock:
+                index = self.stages.get(stage)
+                if index is None:
+                    if len(self.stages) >= MAX_STAGES:
+                        raise ValueError(f"Too many stages, at most {MAX_STAGES}")
+                    index = self.stages[stage] = len(self.stages)
+        return index
+
+    def _items(self):
+        """Copia di (stage, indice), iterabile mentre altri thread aggiungono stage"""
+        with self._lock:
+            return list(self.stages.items())
+
+    def start(self) -> int:
+        return time.perf_counter_ns()
+
+    def lap(self, stage: str, start: int) -> int:
+        """Registra la durata da start e restituisce l'istante attuale, inizio dello stage successivo"""
+        now = time.perf_counter_ns()
+        elapsed = now - start
+        index = self._index(stage)
+
+        count = int(self.count[index])
+        self.recent[index, count % self.window] = elapsed
+        self.buckets[index, bisect_left(_BUCKETS_NS, elapsed)] += 1
+        self.total_ns[index] += elapsed
+        self.count[index] = count + 1
+        self.last_ns[index] = elapsed
+        return now
+
+    def latest(self, prefix: str = '') -> Dict[str, float]:
+        """Ultima durata in ms degli stage che iniziano con prefix, per il dizionario info"""
+        return {stage: int(self.last_ns[index]) / 1e6 for stage, index in self._items() if stage.startswith(prefix)}
+
+    def summary(self) -> Dict[str, Dict]:
+        """Statistiche per stage: totali dall'avvio e percentili sulle ultime durate"""
+        summary = {}
+        for stage, index in self._items():
+            count = int(self.count[index])
+            recent = self.recent[index, :min(count, self.window)] / 1e6
+            summary[stage] = {
+                'count': count,
+                'total_s': float(self.total_ns[index]) / 1e9,
+                'mean_ms': float(self.total_ns[index]) / 1e6 / max(count, 1),
+                'p50_ms': float(np.percentile(recent, 50)),
+                'p90_ms': float(np.percentile(recent, 90)),
+                'p99_ms': float(np.percentile(recent, 99)),
+                'max_ms': float(recent.max()),
+            }
+        return summary
+
+    def prometheus(self, metric: str = 'mario_stage_seconds') -> str:
+        lines = [
+            f"# HELP {metric} Duration of each stage of the training loop",
+            f"# TYPE {metric} histogram",
+        ]
+        for stage, index in self._items():
+            cumulative = np.cumsum(self.buckets[index])
+            for bound, value in zip(BUCKETS + ('+Inf',), cumulative):
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {value}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {self.total_ns[index] / 1e9}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {self.count[index]}')
+
+        lines += [f"# HELP {metric}_recent Quantiles of the last durations of each stage",
+                  f"# TYPE {metric}_recent gauge"]
+        for stage, values in self.summary().items():
+            for quantile in ('50', '90', '99'):
+                lines.append(f'{metric}_recent{{stage="{stage}",quantile="0.{quantile}"}} '
+                             f'{values[f"p{quantile}_ms"] / 1e3}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str = None):
+        """Scrive le metriche su file, sostituendo il precedente in modo atomico"""
+        path = path or self.path
+        if path.endswith('.prom'):
+            content = self.prometheus()
+        else:
+            content = json.dumps(self.summary(), indent=2)
+
+        temp = f"{path}.tmp"
+        with open(temp, 'w') as f:
+            f.write(content)
+        os.replace(temp, path)
+
+    def maybe_dump(self):
+        """Dump periodico, da chiamare nel loop di training"""
+        if self.path is None:
+            return
+
+        now = time.monotonic()
+        if now >= self._next_dump:
+            self._next_dump = now + self.dump_interval
+            self.dump()
@@ -0,0 +1,166 @@
+# 17.10.26
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+
+# External libraries
+import numpy as np
+
+
+# Internal utilities
+from .environment import MarioEnvironment, observation_specs
+
+
+def _attach(names: Dict[str, str], specs: Dict, num_envs: int, ring_size: int):
+    """Apre i blocchi di shared memory e li espone come array (num_envs, ring_size, ...)"""
+    blocks, arrays = [], {}
+    for key, (shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=names[key])
+        blocks.append(block)
+        arrays[key] = np.ndarray((num_envs, ring_size + 1) + shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def _worker(index, rom_path, env_kwargs, names, num_envs, ring_size, auto_reset, remote, parent_remote):
+    parent_remote.close()
+    blocks, arrays = _attach(names, observation_specs(env_kwargs.get('observation', 'pixels')), num_envs, ring_size)
+    env = MarioEnvironment(rom_path, **env_kwargs)
+
+    def write(obs, slot):
+        for key, value in obs.items():
+            arrays[key][index, slot] = value
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+
+            if cmd == 'step':
+                action, slot = data
+                obs, reward, done, info = env.step(action)
+
+                if done and auto_reset:
+                    # L'osservazione finale va nello slot extra, quella di reset nello slot corrente
+                    write(obs, ring_size)
+                    info['final_observation'] = True
+                    obs = env.reset()
+
+                write(obs, slot)
+                remote.send((reward, done, info))
+
+            elif cmd == 'reset':
+                write(env.reset(), data)
+                remote.send(None)
+
+            elif cmd == 'close':
+                break
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        env.close()
+        remote.close()
+
+
+class VectorMarioEnvironment:
+    """
+    Esegue num_envs MarioEnvironment in processi separati.
+    I worker scrivono le osservazioni in un ring di ring_size slot per ambiente in shared memory,
+    step/reset restituiscono viste sullo slot corrente, valide per le ring_size - 1 chiamate successive.
+    """
+    def __init__(self, rom_path, num_envs, ring_size=2, auto_reset=True, start_method='spawn', **env_kwargs):
+        env_kwargs.setdefault('headless', True)
+        self.num_envs = num_envs
+        self.ring_size = ring_size
+        self.auto_reset = auto_reset
+        self.cursor = 0
+        self.closed = False
+        specs = observation_specs(env_kwargs.get('observation', 'pixels'))
+
+        # Un blocco di shared memory per chiave, con uno slot extra per le osservazioni finali
+        self._blocks = []
+        names = {}
+        for key, (shape, dtype) in specs.items():
+            size = int(np.prod((num_envs, ring_size + 1) + shape)) * np.dtype(dtype).itemsize
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self._blocks.append(block)
+            names[key] = block.name
+
+        self._arrays = {
+            key: np.ndarray((num_envs, ring_size + 1) + shape, dtype=dtype, buffer=block.buf)
+            for block, (key, (shape, dtype)) in zip(self._blocks, specs.items())
+        }
+
+        ctx = mp.get_context(start_method)
+        self.remotes, self.processes = [], []
+        for index in range(num_envs):
+            remote, worker_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(index, rom_path, env_kwargs, names, num_envs, ring_size, auto_reset, worker_remote, remote),
+                daemon=True
+            )
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+    def _observations(self, slot: int) -> Dict[str, np.ndarray]:
+        return {key: array[:, slot] for key, array in self._arrays.items()}
+
+    def _advance(self) -> int:
+        self.cursor = (self.cursor + 1) % self.ring_size
+        return self.cursor
+
+    def reset(self) -> Dict[str, np.ndarray]:
+        slot = self._advance()
+        for remote in self.remotes:
+            remote.send(('reset', slot))
+        for remote in self.remotes:
+            remote.recv()
+
+        return self._observations(slot)
+
+    def step(self, actions) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray, List[Dict]]:
+        slot = self._advance()
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', (int(action), slot)))
+
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos = []
+        for i, remote in enumerate(self.remotes):
+            reward, done, info = remote.recv()
+            rewards[i] = reward
+            dones[i] = done
+
+            # Con auto reset l'osservazione restituita è già quella del nuovo episodio
+            if info.pop('final_observation', False):
+                info['final_observation'] = {key: array[i, self.ring_size] for key, array in self._arrays.items()}
+            infos.append(info)
+
+        return self._observations(slot), rewards, dones, infos
+
+    def close(self):
+        if self.closed:
+            return
+
+        for remote in self.remotes:
+            try:
+                remote.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+
+        # Le viste restituite possono essere ancora vive, il segmento viene comunque rimosso
+        self._arrays = None
+        for block in self._blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass
+            block.unlink()
+        self.closed = True
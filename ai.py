@@ -1,347 +1,54 @@
 import os
-import cv2
-import gym
 import sys
+import json
 import time
-import numpy as np
-from pyboy import PyBoy
-from pyboy.utils import WindowEvent
+import argparse
 
-from Src.Engine.engine import MarioLandMonitor
-from Src.Engine.dataclass import LocalPlayer, Entity
+from Src.environment import MarioEnvironment
+from Src.vector_env import VectorMarioEnvironment
 from Src.model import EnhancedDQNAgent
+from Src.learner import AsyncLearner
+from Src.recording import EpisodeRecorder
+from Src.dataset import DatasetWriter, TransitionDataset, DatasetSampler
+from Src.timing import StageTimer
 
 
-emulate_speed = 20
+def start_learner(agent, batch_size, replay_ratio):
+    """Avvia il learner in background se replay_ratio > 0, altrimenti il replay resta inline"""
+    if replay_ratio <= 0:
+        return None
 
+    agent.use_async_actor()
+    learner = AsyncLearner(agent, batch_size, replay_ratio)
+    learner.start()
+    return learner
 
-class MarioEnvironment(gym.Env):
-    def __init__(self, rom_path):
-        super().__init__()
-        self.rom_path = rom_path
-        self.pyboy = PyBoy(rom_path, window="SDL2", debug=False)
-        self.monitor = MarioLandMonitor(self.pyboy)
-        self.pyboy.set_emulation_speed(emulate_speed)
-        
-        self.action_space = gym.spaces.Discrete(5)
-        #self.observation_space = gym.spaces.Box(low=0, high=255, shape=(84, 84, 1), dtype=np.uint8)
+def pretrain(agent, dataset_path, batch_size, updates):
+    """Training offline da un dataset di transizioni, prima di interagire con l'ambiente"""
+    dataset = TransitionDataset(dataset_path)
+    if dataset.observation != agent.observation:
+        raise ValueError(f"Dataset observation is '{dataset.observation}', agent uses '{agent.observation}'")
 
-        # Aumentiamo lo state space per includere:
-        # - Frame processato (84x84x1)
-        # - Informazioni del giocatore (9 features)
-        # - Informazioni dei nemici (5 features per nemico, max 10 nemici)
-        self.observation_space = gym.spaces.Dict({
-            'image': gym.spaces.Box(low=0, high=255, shape=(84, 84, 1), dtype=np.uint8),
-            'player_state': gym.spaces.Box(low=-np.inf, high=np.inf, shape=(10,), dtype=np.float32),
-            'enemies_state': gym.spaces.Box(low=-np.inf, high=np.inf, shape=(11, 10), dtype=np.float32)
-        })
-        
-        self.screen_dims = self.pyboy.screen.raw_buffer_dims
-        self.inactivity_episodes = 0
-        self.consecutive_stuck_episodes = 0
-        self.long_jump_mode = False
-        
-        self.actions = {
-            0: [],  # No action
-            1: [(WindowEvent.PRESS_ARROW_RIGHT, None)],  # Continuous right movement
-            2: [(WindowEvent.PRESS_ARROW_LEFT, None)],   # Continuous left movement
-            3: [(WindowEvent.PRESS_BUTTON_A, WindowEvent.RELEASE_BUTTON_A)],  # Normal jump
-            4: [(WindowEvent.PRESS_ARROW_RIGHT, None), (WindowEvent.PRESS_BUTTON_A, WindowEvent.RELEASE_BUTTON_A)]  # Jump + Right
-        }
-        
-        self.last_position = 0
-        self.last_score = 0
-        self.stuck_counter = 0
-        self.max_steps_per_level = 2000
-        self.current_steps = 0
-        self.was_alive = True
-
-    def process_player_state(self, player: LocalPlayer):
-        """Converte lo stato del giocatore in un array numpy"""
-        return np.array([
-            player.position.x,
-            player.position.y,
-            player.rect.left,
-            player.rect.top,
-            player.rect.width,
-            player.rect.height,
-            1.0 if player.direction == 'Right' else 0.0,
-            1.0 if player.jump_state == 'Jumping' else 0.0,
-            player.grounded,
-            player.starman_timer
-        ], dtype=np.float32)
-    
-    def process_enemies_state(self, enemies):
-        """Converte lo stato dei nemici in un array numpy"""
-        enemy_array = np.zeros((10, 11), dtype=np.float32)  # Max 5 nemici, 5 features per nemico
-        
-        for i, enemy in enumerate(enemies[:10]):  # Limitiamo a 5 nemici
-            enemy: Entity = enemy
-
-            enemy_array[i] = [
-                enemy.i_type,
-                enemy.position.x,
-                enemy.position.y,
-                enemy.rect.left,
-                enemy.rect.top,
-                enemy.rect.width,
-                enemy.rect.height,
-                enemy.hp,
-                enemy.pose,
-                enemy.distance,
-                enemy.collisione
-            ]
-            
-        return enemy_array
-
-    def get_state(self, player, enemies):
-        """Combina tutti gli stati in un dizionario"""
-        return {
-            'image': self.preprocess_frame(),
-            'player_state': self.process_player_state(player),
-            'enemies_state': self.process_enemies_state(enemies)
-        }
-    
-    def _init_game(self):
-        """Inizializza il gioco solo se siamo nella schermata iniziale"""
-        if self.pyboy.memory[0xFFB3] == 15:  # Siamo nella schermata iniziale
-            self.pyboy.send_input(WindowEvent.PRESS_BUTTON_START)
-            self.pyboy.tick()
-            self.pyboy.send_input(WindowEvent.RELEASE_BUTTON_START)
-            
-            # Aspetta che il gioco inizi effettivamente
-            for _ in range(60):
-                self.pyboy.tick()
-
-    def preprocess_frame(self):
-        screen = np.frombuffer(self.pyboy.screen.raw_buffer, dtype=np.uint8).reshape(*self.screen_dims, 4)
-        gray = screen[:, :, 0]
-        resized = cv2.resize(gray, (84, 84), interpolation=cv2.INTER_AREA)
-        return resized.reshape(84, 84, 1) / 255.0
-        
-    def is_alive(self):
-        GAME_STATES_DEAD = (1, 3, 4, 60)
-        TIMER_DEATH = 0x90
-
-        if self.pyboy.memory[0xFFB3] in GAME_STATES_DEAD:
-            return False
-    
-        if self.pyboy.memory[0xFFA6] == TIMER_DEATH:
-            return False
-
-        return True
-        
-    def calculate_danger_reward(self, player, enemies):
-        """Calcola reward basato sulla vicinanza ai nemici"""
-        danger_reward = 0
-        player_x = player.position.x
-        player_y = player.position.y
-        
-        for enemy in enemies:
-            enemy: Entity = enemy
-            distance = enemy.distance
-            
-            if distance < 30:  # Nemico molto vicino
-                danger_reward -= 5
-
-            elif distance < 45:  # Nemico abbastanza vicino
-                danger_reward -= 2
-
-            elif enemy.collisione:
-                danger_reward -= 100
-            
-            # Bonus per evitare nemici saltando
-            if player.jump_state == 'Jumping' and distance < 40:
-                danger_reward += 3
-                
-        return danger_reward
-    
-    def step(self, action):
-        self._init_game()
-        self.current_steps += 1
-        localPlayer, landGame, entityList = self.monitor.get_game_state()
-        
-        # Gestione speciale del salto in modalità long_jump
-        if self.long_jump_mode and action in [3, 4]:
-            # Tieni premuto A più a lungo per salti più lunghi
-            for _ in range(20):  # Aumentato da 12 a 20 frames
-                if not self.is_alive():
-                    break
-                self.pyboy.send_input(WindowEvent.PRESS_BUTTON_A)
-                if action == 4:  # Se è un salto con movimento, mantieni premuto anche destra
-                    self.pyboy.send_input(WindowEvent.PRESS_ARROW_RIGHT)
-                self.pyboy.tick()
-            self.pyboy.send_input(WindowEvent.RELEASE_BUTTON_A)
-        else:
-            # Esegui l'azione normalmente
-            for press_event, release_event in self.actions[action]:
-                self.pyboy.send_input(press_event)
-                self.pyboy.tick()
-                if release_event:
-                    self.pyboy.send_input(release_event)
-        
-        # Rilascia i tasti solo se l'azione non è di movimento continuo
-        if action not in [1, 2]:
-            self.pyboy.send_input(WindowEvent.RELEASE_ARROW_RIGHT)
-            self.pyboy.send_input(WindowEvent.RELEASE_ARROW_LEFT)
-        
-        # Ottieni nuovo stato
-        mario_x = localPlayer.position.x
-        mario_y = localPlayer.position.y
-        score = self.pyboy.game_wrapper.score
-        lives = landGame.lives
-        
-        # Calcola reward con valori più bilanciati
-        reward = 0
-        done = False
-        x_progress = mario_x - self.last_position
-        
-        # Controlla se Mario è fermo
-        if abs(x_progress) < 1:
-            self.stuck_counter += 1
-        else:
-            self.stuck_counter = 0
-            
-        # Penalità per inattività
-        if self.stuck_counter > 600:
-            reward -= 500
-            self.inactivity_episodes += 1
-            self.consecutive_stuck_episodes += 1
-            print(f"Episode terminated due to inactivity! (Stuck episodes: {self.consecutive_stuck_episodes})")
-            
-            # Attiva la modalità long jump se troppi episodi consecutivi bloccati
-            if self.consecutive_stuck_episodes >= 3:
-                self.long_jump_mode = True
-                print("Activating long jump mode to overcome obstacles!")
-        else:
-            # Se completiamo un episodio senza bloccarci, resettiamo il contatore
-            self.consecutive_stuck_episodes = 0
-            
-        # Reward extra per salti lunghi quando necessari
-        if self.long_jump_mode and action in [3, 4]:
-            initial_y = mario_y
-            max_height_reached = False
-            jump_distance = 0
-            
-            # Traccia l'altezza e la distanza del salto
-            if mario_y < initial_y:  # Sta salendo
-                max_height_reached = True
-            elif max_height_reached and mario_y > initial_y:  # Sta scendendo
-                jump_distance = abs(mario_x - self.last_position)
-                
-            # Reward per salti più lunghi
-            if jump_distance > 20:  # Soglia per un "salto lungo"
-                reward += jump_distance * 0.5
-                print(f"Good long jump! Distance: {jump_distance}")
-        
-        # Reward standard per movimento
-        if x_progress > 0:
-            reward += x_progress * 0.1
-        else:
-            reward -= abs(x_progress)
-            
-        # Reward per score
-        if score > self.last_score:
-            reward += (score - self.last_score) * 0.5
-            
-        # Reward per salto riuscito
-        if self.is_jumping_successful(mario_y) and action in [3, 4]:
-            reward += 2
-         
-        # Penalità per salti eccessivi (solo quando non in long_jump_mode)
-        if not self.long_jump_mode and action in [3, 4] and not self.is_jumping_necessary(entityList):
-            reward -= 1
-        
-        # Danger reward
-        danger_reward = self.calculate_danger_reward(localPlayer, entityList)
-        reward += danger_reward
-        
-        # Punizione per morte
-        if not self.is_alive():
-            reward = -100
-            done = True
-            
-        self.last_position = mario_x
-        self.last_score = score
-        
-        return self.get_state(localPlayer, entityList), reward, done, {
-            'x_pos': mario_x,
-            'y_pos': mario_y,
-            'score': score,
-            'lives': lives,
-            'steps': self.current_steps,
-            'is_alive': self.is_alive(),
-            'stuck_time': self.stuck_counter,
-            'long_jump_mode': self.long_jump_mode
-        }
-        
-    def is_jumping_necessary(self, enemies):
-        """Verifica se il salto è necessario in base alla presenza di nemici o ostacoli"""
-        for enemy in enemies:
-            if enemy.distance < 40:
-                return True
-        return False
-
-    def is_jumping_successful(self, mario_y):
-        return mario_y < 100
-        
-    def reset_level(self):
-        """Reset completo del livello"""
-        self.pyboy.set_emulation_speed(1)
-        
-        # Attendi che il gioco sia pronto per il reset
-        wait_frames = 0
-        max_wait_frames = 120
-        
-        while not self.is_alive() and wait_frames < max_wait_frames:
-            self._init_game()  # Controlla e inizializza se necessario
-            self.pyboy.tick()
-            wait_frames += 1
-        
-        # Aspetta alcuni frame per stabilizzare
-        for _ in range(30):
-            self._init_game()  # Controlla e inizializza se necessario
-            self.pyboy.tick()
-        
-        # Ripristina la velocità normale
-        self.pyboy.set_emulation_speed(emulate_speed)
-        self.current_steps = 0
-        self.stuck_counter = 0
-        self.was_alive = True
-        self.last_position = 0
-        self.last_score = 0
-
-    def reset(self):
-        if not hasattr(self, 'pyboy'):
-            self.pyboy = PyBoy(self.rom_path, window="SDL2")
-            self.monitor = MarioLandMonitor(self.pyboy)
-            self.pyboy.set_emulation_speed(emulate_speed)
-            for _ in range(30):
-                self._init_game()  # Controlla e inizializza se necessario
-                self.pyboy.tick()
-        else:
-            self.reset_level()
-        
-        self.last_position = 0
-        self.last_score = 0
-        self.current_steps = 0
-        self.stuck_counter = 0
-        self.was_alive = True
-
-        # Reset della modalità long jump solo se abbiamo completato con successo
-        if not self.consecutive_stuck_episodes >= 3:
-            self.long_jump_mode = False
-        
-        return self.preprocess_frame()
-    
-    def close(self):
-        if hasattr(self, 'pyboy'):
-            self.pyboy.stop()
-
-def train():
-    env = MarioEnvironment(os.path.join('rom', 'mario.gb'))
+    sampler = DatasetSampler(dataset, batch_size)
+    try:
+        start = time.time()
+        agent.pretrain(sampler, batch_size, updates)
+        print(f"Pretraining: {updates} updates on {len(dataset)} transitions in {time.time() - start:.1f}s")
+    finally:
+        sampler.stop()
+
+def train(headless=False, fast_reset=False, prioritized=False, replay_ratio=0.0, observation='pixels', archive_size=0,
+          stage_library=None, stage_weights=None, record=None, collect=None, pretrain_path=None, pretrain_updates=0,
+          timings=None, reward_config=None, memory_size=50000):
+    # Un solo timer per ambiente e agente, con dump periodico delle metriche su file
+    timer = StageTimer(path=timings) if timings else None
+    env = MarioEnvironment(os.path.join('rom', 'mario.gb'), headless=headless, fast_reset=fast_reset, noop_max=30,
+                           observation=observation, archive_size=archive_size,
+                           stage_library=stage_library, stage_weights=stage_weights, timer=timer,
+                           reward_config=reward_config)
     action_size = 5
-    agent = EnhancedDQNAgent(action_size)
+    agent = EnhancedDQNAgent(action_size, memory_size=memory_size, prioritized=prioritized, observation=observation,
+                             timer=timer)
     batch_size = 1024
     episodes = 1000
     
@@ -350,22 +57,40 @@ def train():
 
     start_time = time.time()
     save_interval = 120
+    if pretrain_path:
+        pretrain(agent, pretrain_path, batch_size, pretrain_updates)
+
+    learner = start_learner(agent, batch_size, replay_ratio)
+    recorder = EpisodeRecorder(record) if record else None
+    writer = DatasetWriter(collect, observation) if collect else None
 
     try:
         for episode in range(episodes):
             state = env.reset()
             total_reward = 0
+            if recorder:
+                recorder.begin(env, state)
             
             while True:
                 action = agent.act(state)
                 next_state, reward, done, info = env.step(action)
+                if recorder:
+                    recorder.record(env, action, reward, done, info)
 
                 agent.remember(state, action, reward, next_state, done)
+                if writer:
+                    writer.add(state, action, reward, next_state, done)
                 state = next_state
                 total_reward += reward
+
+                if learner:
+                    learner.notify_step()
+                    agent.sync_actor()
+                if timer:
+                    timer.maybe_dump()
             
                 if time.time() - start_time >= save_interval:
-                    if len(agent.memory) > batch_size:
+                    if not learner and len(agent.memory) > batch_size:
                         agent.replay(batch_size)
                     agent.model.save(os.path.join(save_dir, f"mario_model_episode_{episode + 1}.h5"))
                     print(f"\nModel saved: {os.path.join(save_dir, f'mario_model_episode_{episode + 1}.h5')}")
@@ -375,15 +100,131 @@ def train():
                     print(f"\nLevel Reset! Lives remaining: {info['lives']}")
                     break
                     
-            agent.update_target_model()
+            if not learner:
+                agent.update_target_model()
             print(f"\nEpisode: {episode + 1}/{episodes}, Total Reward: {total_reward:.1f}, Epsilon: {agent.epsilon:.3f}")
+            if learner:
+                print(f"Learner: {learner.updates} updates, {learner.update_rate:.1f} updates/s")
+
+    except KeyboardInterrupt:
+        print("\nStopped ...")
+        sys.exit(0)
+
+    finally:
+        if learner:
+            learner.stop()
+        if recorder:
+            recorder.close()
+        if writer:
+            writer.close()
+        if timer:
+            timer.dump()
+        env.close()
+
+def train_vector(num_envs, headless=True, fast_reset=False, prioritized=False, replay_ratio=0.0, observation='pixels', archive_size=0,
+                 stage_library=None, stage_weights=None, reward_config=None, memory_size=50000):
+    """Training con num_envs ambienti in processi separati"""
+    env = VectorMarioEnvironment(os.path.join('rom', 'mario.gb'), num_envs, headless=headless, fast_reset=fast_reset, noop_max=30,
+                                 observation=observation, archive_size=archive_size,
+                                 stage_library=stage_library, stage_weights=stage_weights, reward_config=reward_config)
+    action_size = 5
+    agent = EnhancedDQNAgent(action_size, memory_size=memory_size, prioritized=prioritized, observation=observation)
+    batch_size = 1024
+    episodes = 1000
+
+    save_dir = "mario_saves"
+    os.makedirs(save_dir, exist_ok=True)
+
+    start_time = time.time()
+    save_interval = 120
+    episode = 0
+    total_rewards = [0.0] * num_envs
+    learner = start_learner(agent, batch_size, replay_ratio)
+
+    try:
+        states = env.reset()
+        env_states = [{key: value[i] for key, value in states.items()} for i in range(num_envs)]
+
+        while episode < episodes:
+            # Un solo forward per tutti gli ambienti
+            actions = agent.act_batch(states)
+            next_states, rewards, dones, infos = env.step(actions)
+
+            for i in range(num_envs):
+                # Con auto reset next_states contiene già il nuovo episodio
+                current = {key: value[i] for key, value in next_states.items()}
+                next_state = infos[i].get('final_observation') or current
+                # Lo stesso dizionario torna come stato al passo successivo: il buffer non ne riscrive il frame
+                agent.remember(env_states[i], actions[i], rewards[i], next_state, dones[i], stream=i)
+                env_states[i] = current
+                total_rewards[i] += rewards[i]
+
+                if dones[i]:
+                    episode += 1
+                    if not learner:
+                        agent.update_target_model()
+                    print(f"\nEpisode: {episode}/{episodes} (env {i}), Total Reward: {total_rewards[i]:.1f}, Epsilon: {agent.epsilon:.3f}")
+                    total_rewards[i] = 0.0
+
+            states = next_states
+
+            if learner:
+                learner.notify_step(num_envs)
+                agent.sync_actor()
+
+            if time.time() - start_time >= save_interval:
+                if not learner and len(agent.memory) > batch_size:
+                    agent.replay(batch_size)
+                agent.model.save(os.path.join(save_dir, f"mario_model_episode_{episode + 1}.h5"))
+                print(f"\nModel saved: {os.path.join(save_dir, f'mario_model_episode_{episode + 1}.h5')}")
+                start_time = time.time()
 
     except KeyboardInterrupt:
         print("\nStopped ...")
         sys.exit(0)
 
     finally:
+        if learner:
+            learner.stop()
         env.close()
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--envs', type=int, default=1, help="Numero di ambienti in processi separati")
+    parser.add_argument('--fast-reset', action='store_true', help="Reset da save-state in memoria")
+    parser.add_argument('--prioritized', action='store_true', help="Prioritized experience replay")
+    parser.add_argument('--replay-ratio', type=float, default=0.0, help="Update per step del learner in background (0 = replay inline)")
+    parser.add_argument('--observation', choices=('pixels', 'tiles'), default='pixels', help="Frame dello schermo o griglia di tile")
+    parser.add_argument('--archive', type=int, default=0, help="Celle dell'archivio Go-Explore per i reset (0 = disattivato)")
+    parser.add_argument('--stages', help="Libreria di stage creata con build_stages.py")
+    parser.add_argument('--stage-weights', nargs='*', default=[], help="Pesi degli stage, es. 2-3=1 4-2=2")
+    parser.add_argument('--record', help="File in cui registrare gli episodi (solo con un ambiente), vedi play_recording.py")
+    parser.add_argument('--collect', help="Cartella in cui salvare le transizioni come dataset offline (solo con un ambiente)")
+    parser.add_argument('--pretrain', help="Dataset offline (build_dataset.py o --collect) su cui allenare prima di giocare")
+    parser.add_argument('--pretrain-updates', type=int, default=10000, help="Update di pretraining sul dataset")
+    parser.add_argument('--timings', help="File delle metriche di tempo per stage, Prometheus (.prom) o JSON (solo con un ambiente)")
+    parser.add_argument('--memory-size', type=int, default=50000, help="Capacità del replay buffer in transizioni")
+    parser.add_argument('--reward-config', help="JSON con i termini del reward e i loro pesi (default: rewards.DEFAULT_REWARD_CONFIG)")
+    args = parser.parse_args()
+
+    reward_config = None
+    if args.reward_config:
+        with open(args.reward_config) as f:
+            reward_config = json.load(f)
+
+    stage_weights = None
+    if args.stage_weights:
+        stage_weights = {name: float(weight) for name, weight in (item.split('=') for item in args.stage_weights)}
+
+    if args.envs > 1:
+        train_vector(args.envs, fast_reset=args.fast_reset, prioritized=args.prioritized, replay_ratio=args.replay_ratio,
+                     observation=args.observation, archive_size=args.archive,
+                     stage_library=args.stages, stage_weights=stage_weights, reward_config=reward_config,
+                     memory_size=args.memory_size)
+    else:
+        train(headless=args.headless, fast_reset=args.fast_reset, prioritized=args.prioritized, replay_ratio=args.replay_ratio,
+              observation=args.observation, archive_size=args.archive,
+              stage_library=args.stages, stage_weights=stage_weights, record=args.record,
+              collect=args.collect, pretrain_path=args.pretrain, pretrain_updates=args.pretrain_updates,
+              timings=args.timings, reward_config=reward_config, memory_size=args.memory_size)
\ No newline at end of file
@@ -0,0 +1,276 @@
+# 17.10.26
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+
+
+# External libraries
+import numpy as np
+import pyboy
+
+
+# Internal utilities
+from Src.environment import MarioEnvironment
+
+
+# Variable
+# Script di azioni fisso: corsa a destra con salti, qualche pausa e un passo indietro
+ACTION_SCRIPT = (1, 1, 1, 4, 1, 1, 3, 1, 0, 1, 2, 1, 4, 4, 1, 1)
+RESET_INTERVAL = 250        # Step dopo cui l'episodio riparte dallo stato fisso anche senza morire
+RESET_CALLS = 50            # Reset misurati a parte, dopo gli step
+WARMUP = 5                  # Chiamate non misurate (compilazione dei grafi TF, cache)
+MIN_CALLS = 20              # Chiamate minime per run perché un benchmark venga confrontato col baseline
+
+
+class Timings:
+    """Durate in nanosecondi per benchmark, separate per run"""
+    def __init__(self):
+        self.runs = []
+        self.new_run()
+
+    def new_run(self):
+        self.runs.append({})
+
+    def add(self, name: str, start: int):
+        self.runs[-1].setdefault(name, []).append(time.perf_counter_ns() - start)
+
+    def summary(self) -> dict:
+        """Statistiche su tutti i campioni; ops_per_s è la mediana dei throughput dei singoli run"""
+        results = {}
+        for name in dict.fromkeys(name for run in self.runs for name in run):
+            per_run = [np.array(run[name], dtype=np.float64) / 1e6 for run in self.runs if name in run]
+            run_ops = [len(ms) / max(float(ms.sum()) / 1e3, 1e-12) for ms in per_run]
+            ms = np.concatenate(per_run)
+            results[name] = {
+                'count': len(ms),
+                'runs': len(per_run),
+                'min_run_count': min(len(run) for run in per_run),
+                'total_s': round(float(ms.sum()) / 1e3, 4),
+                'ops_per_s': round(float(np.median(run_ops)), 2),
+                'run_ops_per_s': [round(ops, 2) for ops in run_ops],
+                'mean_ms': round(float(ms.mean()), 4),
+                'p50_ms': round(float(np.percentile(ms, 50)), 4),
+                'p90_ms': round(float(np.percentile(ms, 90)), 4),
+                'p99_ms': round(float(np.percentile(ms, 99)), 4),
+                'max_ms': round(float(ms.max()), 4),
+            }
+        return results
+
+
+def environment_benchmarks(timings, rom_path, steps, observation, state_path=None, keep_states=256,
+                           resets=RESET_CALLS):
+    """
+    Step dello script di azioni a partire da uno stato fisso: misura step e, sugli stessi frame, la decodifica
+    della RAM e la preparazione dell'osservazione; poi resets fast reset dallo stato fisso.
+
+    Restituisce fino a keep_states transizioni copiate, usate dai benchmark dell'agente.
+    """
+    env = MarioEnvironment(rom_path, headless=True, fast_reset=True, observation=observation)
+    transitions = []
+
+    try:
+        if state_path:
+            with open(state_path, 'rb') as f:
+                env._start_state = io.BytesIO(f.read())
+        else:
+            # Primo inizio livello dal boot: deterministico, diventa lo stato fisso
+            env.reset()
+
+        state = env.reset()
+        monitor = env.monitor
+        episode_steps = 0
+
+        for i in range(steps):
+            action = ACTION_SCRIPT[i % len(ACTION_SCRIPT)]
+
+            start = time.perf_counter_ns()
+            next_state, reward, done, _ = env.step(action)
+            timings.add('step', start)
+
+            if len(transitions) < keep_states:
+                transitions.append((copy_state(state), action, reward, copy_state(next_state), done))
+            state = next_state
+
+            # Decodifica completa dello stesso frame, senza la cache per frame del monitor
+            monitor.invalidate()
+            start = time.perf_counter_ns()
+            player, _, _ = monitor.get_game_state()
+            timings.add('get_game_state', start)
+
+            start = time.perf_counter_ns()
+            monitor._scan_enemy_table(player.position)
+            timings.add('_scan_enemy_table', start)
+
+            if observation == 'pixels':
+                # Forza la copia del frame nello stack come dopo un render
+                env._frame_ready = True
+                start = time.perf_counter_ns()
+                env.preprocess_frame()
+                timings.add('preprocess_frame', start)
+            else:
+                snapshot = monitor.snapshot()
+                start = time.perf_counter_ns()
+                env.tile_grid(snapshot)
+                timings.add('tile_grid', start)
+
+            episode_steps += 1
+            if done or episode_steps >= RESET_INTERVAL:
+                state = env.reset()
+                episode_steps = 0
+
+        # Reset misurati in un ciclo dedicato: durante gli step sono troppo pochi per un confronto
+        for _ in range(resets):
+            start = time.perf_counter_ns()
+            env.reset()
+            timings.add('reset', start)
+
+    finally:
+        env.close()
+
+    return transitions
+
+
+def agent_benchmarks(timings, transitions, observation, iterations, batch_size, agent=None):
+    """
+    act greedy (un forward) e replay (un update) sulle transizioni raccolte dall'ambiente.
+    Restituisce l'agente, da riusare nei run successivi senza ricostruire il modello.
+    """
+    if agent is None:
+        # TensorFlow viene importato solo qui: con --skip-agent il benchmark non ne ha bisogno
+        from Src.model import EnhancedDQNAgent
+
+        # Il buffer deve contenere almeno batch_size transizioni: quelle raccolte vengono ripetute,
+        # con spazio per non sovrascriverle (ogni ripetizione occupa al massimo due slot per transizione)
+        agent = EnhancedDQNAgent(5, memory_size=2 * (batch_size + len(transitions)), observation=observation)
+        while len(agent.memory) < batch_size:
+            for transition in transitions:
+                agent.remember(*transition)
+
+    states = [transition[0] for transition in transitions]
+    for i in range(WARMUP + iterations):
+        start = time.perf_counter_ns()
+        agent.act(states[i % len(states)], training=False)
+        if i >= WARMUP:
+            timings.add('act', start)
+
+    for i in range(WARMUP + iterations):
+        start = time.perf_counter_ns()
+        agent.replay(batch_size)
+        if i >= WARMUP:
+            timings.add('replay', start)
+
+    return agent
+
+
+def copy_state(state):
+    return {key: np.array(value) for key, value in state.items()}
+
+
+def compare(results, baseline, tolerance, min_calls=MIN_CALLS):
+    """
+    Benchmark il cui throughput mediano è sceso più di tolerance rispetto al baseline.
+    I benchmark con meno di min_calls chiamate per run non vengono confrontati: il loro throughput è rumore.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            continue
+
+        calls = min(result.get('min_run_count', result['count']), reference.get('min_run_count', reference['count']))
+        if calls < min_calls:
+            print(f"{name:>20}: {calls} calls per run, fewer than {min_calls}: not compared")
+            continue
+
+        ratio = result['ops_per_s'] / max(reference['ops_per_s'], 1e-12)
+        status = "REGRESSION" if ratio < 1.0 - tolerance else "ok"
+        print(f"{name:>20}: {result['ops_per_s']:>10.1f} ops/s  baseline {reference['ops_per_s']:>10.1f}  "
+              f"x{ratio:.2f}  {status}")
+        if status != "ok":
+            regressions.append(name)
+
+    return regressions
+
+
+def run_benchmarks(rom_path, steps=2000, observation='pixels', state_path=None, agent_iterations=50,
+                   batch_size=256, skip_agent=False, repeats=5):
+    """repeats run completi: il confronto col baseline usa la mediana dei run, meno sensibile al rumore"""
+    timings = Timings()
+    agent = None
+    for repeat in range(repeats):
+        if repeat:
+            timings.new_run()
+        transitions = environment_benchmarks(timings, rom_path, steps, observation, state_path)
+        if not skip_agent:
+            agent = agent_benchmarks(timings, transitions, observation, agent_iterations, batch_size, agent)
+
+    tensorflow_version = None
+    if not skip_agent:
+        import tensorflow as tf
+        tensorflow_version = tf.__version__
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pyboy': getattr(pyboy, '__version__', None),
+            'numpy': np.__version__,
+            'tensorflow': tensorflow_version,
+        },
+        'config': {
+            'steps': steps,
+            'observation': observation,
+            'state': state_path,
+            'agent_iterations': agent_iterations,
+            'batch_size': batch_size,
+            'repeats': repeats,
+        },
+        'results': timings.summary(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rom', default=os.path.join('Rom', 'mario.gb'))
+    parser.add_argument('--state', help="Save-state di partenza (default: primo inizio livello dal boot)")
+    parser.add_argument('--steps', type=int, default=2000, help="Step dello script di azioni")
+    parser.add_argument('--observation', choices=('pixels', 'tiles'), default='pixels')
+    parser.add_argument('--agent-iterations', type=int, default=50, help="Chiamate misurate di act e replay")
+    parser.add_argument('--batch-size', type=int, default=256, help="Batch di replay")
+    parser.add_argument('--skip-agent', action='store_true', help="Solo ambiente e monitor, senza TensorFlow")
+    parser.add_argument('--repeats', type=int, default=5, help="Run completi, confrontati per mediana")
+    parser.add_argument('--output', default='benchmark.json', help="File JSON dei risultati")
+    parser.add_argument('--baseline', help="Risultati precedenti con cui confrontare il throughput")
+    # Su una macchina condivisa a un core run identici arrivano a x0.67 rispetto al baseline
+    parser.add_argument('--tolerance', type=float, default=0.40, help="Calo di throughput accettato (0.40 = 40%%)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.rom, args.steps, args.observation, args.state, args.agent_iterations,
+                            args.batch_size, args.skip_agent, args.repeats)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in report['results'].items():
+        print(f"{name:>20}: {result['ops_per_s']:>10.1f} ops/s  p50 {result['p50_ms']:.3f} ms  "
+              f"p99 {result['p99_ms']:.3f} ms  ({result['count']} calls, {result['runs']} runs)")
+    print(f"Results saved: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if baseline.get('config') != report['config']:
+            print("Warning: baseline was measured with a different configuration")
+
+        regressions = compare(report['results'], baseline, args.tolerance)
+        if regressions:
+            print(f"Performance regressions: {', '.join(regressions)}")
+            sys.exit(1)
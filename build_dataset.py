@@ -0,0 +1,54 @@
+# 17.10.26
+
+import argparse
+
+
+# Internal utilities
+from Src.environment import MarioEnvironment
+from Src.recording import EpisodeReader, EpisodePlayer
+from Src.dataset import DatasetWriter
+
+
+def build_dataset(recordings, output, rom_path=None, shard_size=16384):
+    """Rigioca le registrazioni di EpisodeRecorder e ne salva le transizioni come dataset offline"""
+    writer = None
+
+    try:
+        for path in recordings:
+            with EpisodeReader(path) as reader:
+                observation = reader.header['observation']
+                if writer is None:
+                    writer = DatasetWriter(output, observation, shard_size)
+                elif writer.manifest['observation'] != observation:
+                    raise ValueError(f"{path} uses '{observation}' observations, "
+                                     f"the dataset uses '{writer.manifest['observation']}'")
+
+                env = MarioEnvironment(rom_path or reader.header['rom'], headless=True, observation=observation,
+                                       frame_skip=reader.header['frame_skip'],
+                                       reward_config=reader.header.get('reward_config'))
+                player = EpisodePlayer(reader, env)
+
+                try:
+                    for episode in range(len(reader)):
+                        for transition in player.transitions(episode):
+                            writer.add(*transition)
+                finally:
+                    env.close()
+
+            print(f"{path}: {len(writer)} transitions")
+
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recordings', nargs='+', help="File creati da EpisodeRecorder (ai.py --record)")
+    parser.add_argument('--output', default='dataset')
+    parser.add_argument('--rom', help="ROM da usare al posto di quella salvata nelle registrazioni")
+    parser.add_argument('--shard-size', type=int, default=16384, help="Righe per shard")
+    args = parser.parse_args()
+
+    build_dataset(args.recordings, args.output, args.rom, args.shard_size)
+    print(f"Dataset saved: {args.output}")
@@ -0,0 +1,55 @@
+# 17.10.26
+
+import io
+import os
+import argparse
+
+
+# Internal utilities
+from Src.environment import MarioEnvironment
+from Src.stages import StageLibrary, ALL_STAGES, stage_name
+
+
+def build_stage_library(rom_path, stages=ALL_STAGES):
+    """Avvia il gioco una volta per stage (selezione livello di PyBoy) e salva il primo frame giocabile"""
+    library = StageLibrary({})
+
+    for world, stage in stages:
+        env = MarioEnvironment(rom_path, headless=True)
+        try:
+            env.pyboy.game_wrapper.set_world_level(world, stage)
+            env.reset()
+
+            state = env.monitor.read_state()
+            if (state['current_world'], state['current_stage']) != (world, stage):
+                raise RuntimeError(f"Expected stage {stage_name(world, stage)}, "
+                                   f"got {stage_name(state['current_world'], state['current_stage'])}")
+
+            env.macros.release_all()
+            buffer = io.BytesIO()
+            env.pyboy.save_state(buffer)
+
+            # Lo stato salvato deve restare giocabile anche dopo qualche frame
+            env.check_playable(stage_name(world, stage))
+            library.add(stage_name(world, stage), buffer.getvalue())
+            print(f"Stage {stage_name(world, stage)} saved (frame {env.pyboy.frame_count})")
+
+        finally:
+            env.close()
+
+    return library
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rom', default=os.path.join('rom', 'mario.gb'))
+    parser.add_argument('--output', default='stages.npz')
+    parser.add_argument('--stages', nargs='*', help="Stage da includere, es. 1-1 2-3 (default: tutti)")
+    args = parser.parse_args()
+
+    stages = ALL_STAGES
+    if args.stages:
+        stages = [tuple(int(n) for n in name.split('-')) for name in args.stages]
+
+    build_stage_library(args.rom, stages).save(args.output)
+    print(f"Library saved: {args.output}")
@@ -0,0 +1,41 @@
+# 17.10.26
+
+import argparse
+
+
+# Internal utilities
+from Src.environment import MarioEnvironment
+from Src.recording import EpisodeReader, EpisodePlayer
+
+
+def play_recording(path, episodes=None, rom_path=None, headless=True, verify=True):
+    """Rigioca gli episodi registrati e stampa un riepilogo per episodio"""
+    with EpisodeReader(path) as reader:
+        env = MarioEnvironment(rom_path or reader.header['rom'], headless=headless,
+                               observation=reader.header['observation'], frame_skip=reader.header['frame_skip'],
+                               reward_config=reader.header.get('reward_config'))
+        player = EpisodePlayer(reader, env)
+
+        try:
+            for episode in episodes if episodes is not None else range(len(reader)):
+                total_reward, info = 0.0, {}
+                for _, reward, _, info in player.play(episode, verify):
+                    total_reward += reward
+
+                print(f"Episode {episode}: {reader.episodes[episode]['steps']} steps, "
+                      f"Total Reward: {total_reward:.1f}, X: {info.get('x_pos')}, Score: {info.get('score')}")
+
+        finally:
+            env.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help="File creato da EpisodeRecorder (ai.py --record)")
+    parser.add_argument('--episodes', type=int, nargs='*', help="Episodi da rigiocare (default: tutti)")
+    parser.add_argument('--rom', help="ROM da usare al posto di quella salvata nella registrazione")
+    parser.add_argument('--window', action='store_true', help="Mostra il gioco durante il replay")
+    parser.add_argument('--no-verify', action='store_true', help="Non confrontare RAM e reward con la registrazione")
+    args = parser.parse_args()
+
+    play_recording(args.path, args.episodes, args.rom, headless=not args.window, verify=not args.no_verify)
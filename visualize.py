@@ -67,6 +67,9 @@ def draw_game_state(pyboy, screen):
     mario_rect = pygame.Rect(localPlayer.rect.left, localPlayer.rect.top, localPlayer.rect.width, localPlayer.rect.height)
     pygame.draw.rect(screen, RED, mario_rect, 2)
 
+    # Nearest hazard in front of Mario, from the hitboxes
+    threat_index, _ = monitor.snapshot().nearest_threat()
+
     # Draw enemy entities
     for idx, entity in enumerate(entityList):
         entity: Entity = entity
@@ -78,7 +81,7 @@ def draw_game_state(pyboy, screen):
 
         # Draw enemy rectangle
         enemy_rect = pygame.Rect(entity.rect.left, entity.rect.top, entity.rect.width, entity.rect.height)
-        pygame.draw.rect(screen, BLUE, enemy_rect, 2)
+        pygame.draw.rect(screen, YELLOW if idx == threat_index else BLUE, enemy_rect, 2)
 
         # Draw a yellow dot at the enemy's position
         enemy_center_x = enemy_x * SCALE